@@ -1,13 +1,22 @@
+import asyncio
 import os
-import uuid
-import aiofiles
-import aiohttp
 from fastapi import HTTPException, UploadFile, Form, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from typing import List, Optional
 from Models.Print import Print, PrintSchema
+from Services.BlobStore import BlobStore
+from Services.Pagination import DEFAULT_PAGE_SIZE, parse_fields, keyset_page
+from Services.InferenceClient import InferenceClient
+from Services.Metrics import INFERENCE_BATCH_SIZE, stage
+from Services.PrintJobs import PrintJob, PrintJobQueue
+from Services.ResultCache import result_cache
+from Services.Serialization import model_columns, rows_to_dicts
 from database import get_db
 
+# Максимум изображений в одном запросе POST /api/prints/batch
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "64"))
+
 
 class PrintController:
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
@@ -17,24 +26,41 @@ class PrintController:
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in PrintController.ALLOWED_EXTENSIONS
 
     @staticmethod
-    async def get_prints(session: AsyncSession):
+    async def get_prints(
+            session: AsyncSession,
+            limit: int = DEFAULT_PAGE_SIZE,
+            after_id: Optional[int] = None,
+            printer_id: Optional[int] = None,
+            defect: Optional[int] = None,
+            quality: Optional[int] = None,
+            fields: Optional[str] = None
+    ):
+        only = parse_fields(fields, PrintSchema)
+        filters = []
+        if printer_id is not None:
+            filters.append(Print.printer_id == printer_id)
+        if defect is not None:
+            filters.append(Print.defect == defect)
+        if quality is not None:
+            filters.append(Print.quality == quality)
+
         try:
-            result = await session.execute(select(Print))
-            prints = result.scalars().all()
-            print_schema = PrintSchema(many=True)
-            return {"message": "OK", "data": print_schema.dump(prints)}
+            keys, rows, next_cursor = await keyset_page(session, Print, filters, only, after_id, limit)
+            return {"message": "OK", "data": rows_to_dicts(keys, rows), "next_cursor": next_cursor}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     @staticmethod
     async def get_print(session: AsyncSession, item_id: int):
         try:
-            result = await session.execute(select(Print).filter(Print.id == item_id))
-            selected_print = result.scalar_one_or_none()
+            keys, columns = model_columns(Print)
+            result = await session.execute(select(*columns).filter(Print.id == item_id))
+            selected_print = result.one_or_none()
             if not selected_print:
                 raise HTTPException(status_code=404, detail="Print not found")
-            print_schema = PrintSchema()
-            return {"message": "OK", "data": print_schema.dump(selected_print)}
+            return {"message": "OK", "data": dict(zip(keys, selected_print))}
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
@@ -44,41 +70,40 @@ class PrintController:
             printer_id: int = Form(...),
             quality: int = Form(...),
             session: AsyncSession = Depends(get_db),
-            upload_folder: str = "uploads"  # Убедитесь, что указано правильное значение
+            upload_folder: str = "uploads",  # Убедитесь, что указано правильное значение
+            inference_client: InferenceClient = None
     ):
-        # Проверка файла
-        if not file or file.filename == "":
-            raise HTTPException(status_code=400, detail="No selected image")
+        filename, ext = PrintController.check_upload(file)
+        blob_store = BlobStore(upload_folder)
+        tmp_path, filepath, created = None, None, False
 
-        if not PrintController.allowed_file(file.filename):
-            raise HTTPException(status_code=400, detail="Invalid file type")
+        try:
+            # Загрузка пишется на диск блоками, хэш и размер считаются по ходу
+            with stage("upload_write"):
+                tmp_path, content_hash, size = await blob_store.receive(file)
 
-        # Создание безопасного имени файла и пути к нему после всех проверок
-        filename = PrintController.secure_filename(file.filename)
-        filepath = os.path.join(upload_folder, filename)
+            # Повторная загрузка того же файла не проходит через инференс
+            with stage("cache_lookup"):
+                cached_defect = await result_cache.get(session, content_hash)
+            if cached_defect is not None:
+                is_defected_image = cached_defect
+            else:
+                # Транзакция чтения закрывается до запроса к nyuroprint: соединение
+                # из пула не простаивает и никакие строки не заблокированы на время инференса
+                await session.commit()
+                # Запрос к сервису обработки изображений через общий пул соединений;
+                # файл отправляется потоком с диска, а не из буфера в памяти
+                with stage("inference"):
+                    response_data = await inference_client.process_image(tmp_path, filename, file.content_type)
+                INFERENCE_BATCH_SIZE.observe(1)
+                is_defected_image = response_data.get('defect', False)
 
-        try:
-            # Проверка существования файла и генерация уникального имени
-            while os.path.exists(filepath):
-                name, ext = filename.rsplit('.', 1)
-                unique_id = str(uuid.uuid4())
-                filename = f"{name}_{unique_id}.{ext}"
-                filepath = os.path.join(upload_folder, filename)
-
-            # Асинхронное сохранение файла
-            async with aiofiles.open(filepath, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
-
-            # Асинхронный запрос к сервису обработки изображений
-            async with aiohttp.ClientSession() as session_http:
-                form = aiohttp.FormData()
-                form.add_field('image', content, filename=filename, content_type=file.content_type)
-
-                async with session_http.post('http://nyuroprint:3000/process_images', data=form) as response:
-                    response.raise_for_status()  # Выбрасывает исключение для HTTP ошибок
-                    response_data = await response.json()
-                    is_defected_image = response_data.get('defect', False)
+                await result_cache.put(session, content_hash, response_data.get('model_version'), is_defected_image)
+
+            # Одинаковые загрузки хранятся один раз, на файл лишь добавляется ссылка;
+            # ссылка, результат и строка Print фиксируются одной короткой транзакцией
+            with stage("blob_store"):
+                filepath, created = await blob_store.put(session, tmp_path, content_hash, size, ext)
 
             # Создание записи в базе данных
             new_print = Print(
@@ -88,21 +113,251 @@ class PrintController:
                 quality=quality
             )
             session.add(new_print)
-            await session.commit()
+            with stage("db_commit"):
+                await session.commit()
 
             return {
                 "message": "Print added successfully",
                 "print_id": new_print.id,
-                "defect": is_defected_image
+                "defect": is_defected_image,
+                "cached": cached_defect is not None
             }
 
+        except HTTPException:
+            await session.rollback()
+            raise
+
+        except Exception as e:
+            # Удаление файла в случае ошибки, если его создал этот запрос
+            if created:
+                blob_store.discard_created(filepath)
+            await session.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
+
+        finally:
+            blob_store.discard_tmp(tmp_path)
+
+    @staticmethod
+    async def add_prints_batch(
+            files: List[UploadFile],
+            printer_id: int,
+            quality: int,
+            session: AsyncSession,
+            upload_folder: str,
+            inference_client: InferenceClient
+    ):
+        """
+        Добавляет серию снимков одного принтера за один запрос.
+
+        Файлы принимаются на диск параллельно, промахи кэша уходят в nyuroprint одним
+        запросом /process_images_batch (один вызов модели), а ссылки на файлы и все
+        строки Print вставляются после инференса в одной короткой транзакции. Изображение, на котором nyuroprint вернул ошибку,
+        не сохраняется; результат возвращается по каждому файлу в исходном порядке.
+        """
+        if not files:
+            raise HTTPException(status_code=400, detail="No selected images")
+        if len(files) > MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=413, detail=f"Too many images, max {MAX_BATCH_IMAGES}")
+        checked = [PrintController.check_upload(file) for file in files]
+
+        blob_store = BlobStore(upload_folder)
+        with stage("upload_write"):
+            received = await asyncio.gather(*(blob_store.receive(file) for file in files), return_exceptions=True)
+        failed = next((r for r in received if isinstance(r, BaseException)), None)
+        if failed is not None:
+            for r in received:
+                if not isinstance(r, BaseException) and os.path.exists(r[0]):
+                    os.remove(r[0])
+            raise failed
+
+        items = []
+        for (filename, ext), file, (tmp_path, content_hash, size) in zip(checked, files, received):
+            items.append({
+                "filename": filename,
+                "ext": ext,
+                "content_type": file.content_type,
+                "content_hash": content_hash,
+                "tmp_path": tmp_path,
+                "size": size,
+            })
+
+        stored = []  # пути файлов, созданных в хранилище этим запросом
+        try:
+            with stage("cache_lookup"):
+                for item in items:
+                    item["defect"] = await result_cache.get(session, item["content_hash"])
+                    item["cached"] = item["defect"] is not None
+            # До запроса к nyuroprint транзакция закрыта: ни соединение, ни строки не заняты
+            await session.commit()
+
+            # Одинаковые файлы внутри серии отправляются на инференс один раз
+            misses = {}
+            for item in items:
+                if not item["cached"]:
+                    misses.setdefault(item["content_hash"], []).append(item)
+            if misses:
+                groups = list(misses.values())
+                with stage("inference"):
+                    response_data = await inference_client.process_images_batch(
+                        [(group[0]["tmp_path"], group[0]["filename"], group[0]["content_type"]) for group in groups]
+                    )
+                INFERENCE_BATCH_SIZE.observe(len(groups))
+                model_version = response_data.get("model_version")
+                for group, result in zip(groups, response_data["results"]):
+                    if "error" in result:
+                        for item in group:
+                            item["error"] = result["error"]
+                        continue
+                    await result_cache.put(session, group[0]["content_hash"], model_version, result["defect"])
+                    for item in group:
+                        item["defect"] = result["defect"]
+
+            # Ссылки на файлы и строки Print фиксируются одной короткой транзакцией;
+            # изображение с ошибкой в хранилище не попадает
+            prints = []
+            with stage("blob_store"):
+                for item in items:
+                    if "error" in item:
+                        continue
+                    filepath, created = await blob_store.put(
+                        session, item["tmp_path"], item["content_hash"], item["size"], item["ext"]
+                    )
+                    if created:
+                        stored.append(filepath)
+                    new_print = Print(
+                        printer_id=printer_id,
+                        defect=item["defect"],
+                        img_path=filepath,
+                        quality=quality
+                    )
+                    session.add(new_print)
+                    item["print"] = new_print
+                    prints.append(new_print)
+            with stage("db_commit"):
+                await session.commit()
+
+        except HTTPException:
+            await session.rollback()
+            raise
+
+        except Exception as e:
+            for filepath in stored:
+                blob_store.discard_created(filepath)
+            await session.rollback()
+            raise HTTPException(status_code=500, detail=str(e))
+
+        finally:
+            for item in items:
+                blob_store.discard_tmp(item["tmp_path"])
+
+        results = []
+        for item in items:
+            if "error" in item:
+                results.append({"filename": item["filename"], "error": item["error"]})
+            else:
+                results.append({
+                    "filename": item["filename"],
+                    "print_id": item["print"].id,
+                    "defect": item["defect"],
+                    "cached": item["cached"]
+                })
+
+        return {
+            "message": "Prints added successfully",
+            "added": len(prints),
+            "failed": len(items) - len(prints),
+            "results": results
+        }
+
+    @staticmethod
+    async def add_print_async(
+            file: UploadFile,
+            printer_id: int,
+            quality: int,
+            session: AsyncSession,
+            upload_folder: str,
+            job_queue: PrintJobQueue
+    ):
+        """
+        Сохраняет загрузку и строку Print со статусом pending, не дожидаясь инференса.
+
+        defect заполняет фоновый пул PrintJobQueue; статус читается через GET /api/prints/{id}:
+        pending и recovering (задание подобрано другим воркером после падения владельца) —
+        результат ещё не готов.
+        """
+        filename, ext = PrintController.check_upload(file)
+        if job_queue.full():
+            raise HTTPException(status_code=503, detail="Print job queue is full")
+
+        blob_store = BlobStore(upload_folder)
+        tmp_path, content_hash, filepath, created = None, None, None, False
+
+        try:
+            with stage("upload_write"):
+                tmp_path, content_hash, size = await blob_store.receive(file)
+            with stage("blob_store"):
+                filepath, created = await blob_store.put(session, tmp_path, content_hash, size, ext)
+
+            # Результат для уже известного файла доступен сразу
+            cached_defect = await result_cache.get(session, content_hash)
+            status = Print.STATUS_DONE if cached_defect is not None else Print.STATUS_PENDING
+
+            new_print = Print(
+                printer_id=printer_id,
+                defect=cached_defect,
+                img_path=filepath,
+                quality=quality,
+                status=status
+            )
+            if status == Print.STATUS_PENDING:
+                # Пока этот воркер продлевает аренду, задание не заберёт recover() другого
+                job_queue.claim(new_print)
+            session.add(new_print)
+            with stage("db_commit"):
+                await session.commit()
+
+        except HTTPException:
+            await session.rollback()
+            raise
+
         except Exception as e:
+            if created:
+                blob_store.discard_created(filepath)
             await session.rollback()
-            # Удаление файла в случае ошибки
-            if os.path.exists(filepath):  # Используйте стандартный os
-                os.remove(filepath)  # Используйте стандартный os
             raise HTTPException(status_code=500, detail=str(e))
 
+        finally:
+            blob_store.discard_tmp(tmp_path)
+
+        if status == Print.STATUS_PENDING:
+            try:
+                job_queue.enqueue(PrintJob(new_print.id, filepath, filename, file.content_type, content_hash))
+            except HTTPException:
+                new_print.status = Print.STATUS_FAILED
+                await session.commit()
+                raise
+
+        return {
+            "message": "Print accepted",
+            "print_id": new_print.id,
+            "status": status,
+            "defect": cached_defect
+        }
+
+    @staticmethod
+    def check_upload(file: UploadFile):
+        """Проверяет загрузку и возвращает безопасное имя файла и его расширение."""
+        # Проверка файла
+        if not file or file.filename == "":
+            raise HTTPException(status_code=400, detail="No selected image")
+
+        if not PrintController.allowed_file(file.filename):
+            raise HTTPException(status_code=400, detail="Invalid file type")
+
+        # Создание безопасного имени файла после всех проверок
+        filename = PrintController.secure_filename(file.filename)
+        return filename, filename.rsplit('.', 1)[1].lower()
+
     @staticmethod
     def secure_filename(filename: str) -> str:
         """
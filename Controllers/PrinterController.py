@@ -3,6 +3,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List, Optional, Dict, Any
 from Models.Printer import Printer, PrinterSchema
+from Services.PrinterCache import printer_cache
+from Services.Serialization import model_columns, rows_to_dicts
+from Services.Pagination import DEFAULT_PAGE_SIZE, parse_fields, keyset_page
 from pydantic import BaseModel
 
 
@@ -43,27 +46,33 @@ class PrinterCreate(BaseModel):
 
 class PrinterController:
     @staticmethod
-    async def get_printers(session: AsyncSession):
+    async def get_printers(
+            session: AsyncSession,
+            limit: int = DEFAULT_PAGE_SIZE,
+            after_id: Optional[int] = None,
+            fields: Optional[str] = None
+    ):
+        only = parse_fields(fields, PrinterSchema)
         try:
-            result = await session.execute(select(Printer))
-            printers = result.scalars().all()
-            printer_schema = PrinterSchema(many=True)
-            return {"message": "OK", "data": printer_schema.dump(printers)}
+            keys, rows, next_cursor = await keyset_page(session, Printer, (), only, after_id, limit)
+            return {"message": "OK", "data": rows_to_dicts(keys, rows), "next_cursor": next_cursor}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
     @staticmethod
     async def get_printer(session: AsyncSession, item_id: int):
         try:
+            keys, columns = model_columns(Printer)
             result = await session.execute(
-                select(Printer).filter(Printer.id == item_id)
+                select(*columns).filter(Printer.id == item_id)
             )
-            printer = result.scalar_one_or_none()
+            printer = result.one_or_none()
             if not printer:
                 raise HTTPException(status_code=404, detail="Printer not found")
 
-            printer_schema = PrinterSchema()
-            return {"message": "OK", "data": printer_schema.dump(printer)}
+            return {"message": "OK", "data": dict(zip(keys, printer))}
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
@@ -105,7 +114,9 @@ class PrinterController:
                 extr_2_end_g_code=printer_data.extr_2_end_g_code
             )
             session.add(new_printer)
+            await printer_cache.notify(session)
             await session.commit()
+            printer_cache.invalidate_local()
             await session.refresh(new_printer)
 
             return {
@@ -718,7 +729,9 @@ class PrinterController:
             for printer_data in default_printers:
                 new_printer = Printer(**printer_data)
                 session.add(new_printer)
+            await printer_cache.notify(session)
             await session.commit()
+            printer_cache.invalidate_local()
         except Exception as e:
             await session.rollback()
             raise HTTPException(status_code=500, detail=str(e))
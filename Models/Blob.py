@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String
+from database import DataBase
+
+
+class Blob(DataBase):
+    __tablename__ = 'blob'
+
+    content_hash = Column(String(64), primary_key=True)
+    path = Column(String(127), nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<Blob {self.content_hash[:12]} refs={self.ref_count}>'
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String
+from database import DataBase
+
+
+class PredictionCache(DataBase):
+    __tablename__ = 'prediction_cache'
+
+    content_hash = Column(String(64), primary_key=True)
+    model_version = Column(String(63), primary_key=True)
+    defect = Column(Integer, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<PredictionCache {self.content_hash[:12]} {self.model_version}>'
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import declarative_base, relationship
@@ -7,18 +7,37 @@ from database import DataBase
 
 class Print(DataBase):
     __tablename__ = 'print'
+    # Составные индексы под фильтры списка с пагинацией по id
+    __table_args__ = (
+        Index('ix_print_printer_id_id', 'printer_id', 'id'),
+        Index('ix_print_defect_id', 'defect', 'id'),
+        Index('ix_print_quality_id', 'quality', 'id'),
+        # Поиск незавершённых заданий с истёкшей арендой (PrintJobQueue.recover)
+        Index('ix_print_status_claimed_at', 'status', 'claimed_at'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     printer_id = Column(Integer, ForeignKey('printer.id'), nullable=False)
-    defect = Column(Integer, nullable=False)
+    defect = Column(Integer, nullable=True)  # None, пока задание не обработано
     img_path = Column(String(127), nullable=False)
     quality = Column(Integer, nullable=False)
+    status = Column(String(15), nullable=False, default='done', server_default='done')
+    # Аренда незавершённого задания: воркер-владелец и время последнего продления (UTC)
+    claimed_by = Column(String(63), nullable=True, info={'internal': True})
+    claimed_at = Column(DateTime, nullable=True, info={'internal': True})
 
-    def __init__(self, printer_id, defect, img_path, quality):
+    STATUS_PENDING = 'pending'
+    # Задание, подобранное другим воркером после истечения аренды прежнего; результат ещё не готов
+    STATUS_RECOVERING = 'recovering'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, printer_id, defect, img_path, quality, status=STATUS_DONE):
         self.printer_id = printer_id
         self.defect = defect
         self.img_path = img_path
         self.quality = quality
+        self.status = status
 
     def __repr__(self):
         return f'<Print {self.id}>'
@@ -29,3 +48,4 @@ class PrintSchema(Schema):
     defect = fields.Integer(allow_none=True)
     img_path = fields.String(dump_only=True)
     quality = fields.Integer(required=True, validate=validate.Range(min=1))
+    status = fields.String(dump_only=True)
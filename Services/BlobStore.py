@@ -0,0 +1,135 @@
+import hashlib
+import os
+import uuid
+import aiofiles
+from typing import Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.Blob import Blob
+
+CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+
+class BlobStore:
+    """
+    Контентно-адресуемое хранилище загрузок.
+
+    Файл называется по SHA-256 содержимого и лежит в подкаталогах по первым байтам хэша
+    (uploads/ab/cd/abcd...jpg). Одинаковые загрузки не перезаписываются, а увеличивают
+    ref_count в таблице blob; файл удаляется, когда на него не осталось ссылок.
+    """
+
+    def __init__(self, root: str = "uploads"):
+        self.root = root
+
+    def path_for(self, content_hash: str, ext: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], f"{content_hash}.{ext}")
+
+    async def receive(self, file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, str, int]:
+        """
+        Потоково пишет загрузку во временный файл, считая хэш и размер по ходу.
+
+        В памяти одновременно находится не больше одного блока CHUNK_SIZE.
+        Возвращает (путь к временному файлу, хэш, размер).
+        """
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                while chunk := await file.read(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise HTTPException(status_code=413, detail="Image is too large")
+                    digest.update(chunk)
+                    await f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    async def put(
+            self,
+            session: AsyncSession,
+            tmp_path: str,
+            content_hash: str,
+            size: int,
+            ext: str
+    ) -> Tuple[str, bool]:
+        """
+        Переносит принятый файл в хранилище и добавляет ссылку на него в текущей транзакции.
+
+        Возвращает (путь, создан ли blob этим вызовом). Временный файл в любом случае удаляется.
+        Строка blob вставляется до переноса файла: пока транзакция не завершена, её ключ
+        заблокирован, и параллельная загрузка того же файла ждёт, а не берёт файл,
+        который может быть удалён при откате. Транзакцию нужно держать короткой — put
+        вызывается после инференса, непосредственно перед commit.
+        """
+        existing_path = await self._acquire(session, content_hash)
+        if existing_path is not None:
+            os.remove(tmp_path)
+            return existing_path, False
+
+        path = self.path_for(content_hash, ext)
+        try:
+            async with session.begin_nested():
+                session.add(Blob(content_hash=content_hash, path=path, size=size, ref_count=1))
+        except IntegrityError:
+            # Тот же файл параллельно сохранил другой запрос
+            os.remove(tmp_path)
+            return await self._acquire(session, content_hash), False
+        self._move(tmp_path, path)
+        return path, True
+
+    async def _acquire(self, session: AsyncSession, content_hash: str) -> Optional[str]:
+        """Добавляет ссылку на существующий blob и возвращает его путь."""
+        result = await session.execute(
+            update(Blob)
+            .where(Blob.content_hash == content_hash)
+            .values(ref_count=Blob.ref_count + 1)
+            .returning(Blob.path)
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    def _move(tmp_path: str, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Атомарное переименование: файл в хранилище либо целый, либо отсутствует.
+        # Файл, оставшийся от прерванного запроса, заменяется: содержимое то же
+        os.replace(tmp_path, path)
+
+    async def release(self, session: AsyncSession, content_hash: str):
+        """Снимает одну ссылку; файл и запись удаляются вместе с последней ссылкой."""
+        result = await session.execute(
+            update(Blob)
+            .where(Blob.content_hash == content_hash)
+            .values(ref_count=Blob.ref_count - 1)
+            .returning(Blob.ref_count, Blob.path)
+        )
+        row = result.one_or_none()
+        if row is not None and row.ref_count <= 0:
+            await session.execute(delete(Blob).where(Blob.content_hash == content_hash))
+            if os.path.exists(row.path):
+                os.remove(row.path)
+
+    @staticmethod
+    def discard_created(path: str):
+        """
+        Удаляет файл, созданный put() в транзакции, которая будет откачена.
+
+        Вызывается до rollback: пока транзакция держит вставленную строку blob, никто
+        другой не может сослаться на этот файл, поэтому удалять его безопасно.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def discard_tmp(tmp_path: Optional[str]):
+        """Удаляет временный файл загрузки, которая так и не попала в хранилище."""
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import random
+import aiohttp
+from contextlib import ExitStack
+from typing import Optional, Sequence, Tuple
+from Services.Timing import parse_server_timing, record
+
+
+class InferenceClient:
+    """
+    Долгоживущий HTTP-клиент для запросов к сервису nyuroprint.
+
+    Создаётся один раз в lifespan приложения: соединения переиспользуются (keep-alive),
+    размер пула ограничен, у каждого запроса есть таймаут, а сетевые ошибки и ответы
+    502/503/504 повторяются с экспоненциальной задержкой.
+    """
+
+    RETRY_STATUSES = {502, 503, 504}
+
+    def __init__(
+            self,
+            base_url: str = os.getenv("NYUROPRINT_URL", "http://nyuroprint:3000"),
+            pool_limit: int = int(os.getenv("INFERENCE_POOL_LIMIT", "64")),
+            keepalive_timeout: float = float(os.getenv("INFERENCE_KEEPALIVE_TIMEOUT", "60")),
+            timeout: float = float(os.getenv("INFERENCE_TIMEOUT", "60")),
+            retries: int = int(os.getenv("INFERENCE_RETRIES", "2")),
+            backoff: float = float(os.getenv("INFERENCE_BACKOFF", "0.2"))
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_limit = pool_limit
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.pool_waits = 0
+        self.pool_waiting = 0
+
+    async def start(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+        trace_config.on_connection_queued_start.append(self._on_queued_start)
+        trace_config.on_connection_queued_end.append(self._on_queued_end)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[trace_config]
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _on_connection_create(self, session, context, params):
+        self.connections_created += 1
+
+    async def _on_connection_reuse(self, session, context, params):
+        self.connections_reused += 1
+
+    async def _on_queued_start(self, session, context, params):
+        # Все соединения пула заняты, запрос ждёт свободного
+        self.pool_waits += 1
+        self.pool_waiting += 1
+
+    async def _on_queued_end(self, session, context, params):
+        self.pool_waiting -= 1
+
+    async def model_version(self) -> Optional[str]:
+        """Версия модели из /readyz nyuroprint; None, пока сервис не готов."""
+        if self._session is None:
+            await self.start()
+
+        # Короткий таймаут: проверка идёт при старте приложения и не должна его задерживать
+        async with self._session.get(f"{self.base_url}/readyz", timeout=aiohttp.ClientTimeout(total=5)) as response:
+            if response.status != 200:
+                return None
+            return (await response.json()).get("model_version")
+
+    async def process_image(self, filepath: str, filename: str, content_type: Optional[str]) -> dict:
+        """Отправляет файл с диска на /process_images и возвращает JSON-ответ."""
+        return await self._post_files("/process_images", "image", [(filepath, filename, content_type)])
+
+    async def process_images_batch(self, files: Sequence[Tuple[str, str, Optional[str]]]) -> dict:
+        """
+        Отправляет несколько файлов одним multipart-запросом на /process_images_batch.
+
+        files — список (путь, имя, content_type); в ответе results идут в том же порядке.
+        """
+        return await self._post_files("/process_images_batch", "images", files)
+
+    async def _post_files(self, path: str, field: str, files: Sequence[Tuple[str, str, Optional[str]]]) -> dict:
+        if self._session is None:
+            await self.start()
+
+        url = f"{self.base_url}{path}"
+        self.requests += 1
+        for attempt in range(self.retries + 1):
+            try:
+                # Форма собирается заново на каждую попытку: поток файла одноразовый
+                with ExitStack() as stack:
+                    form = aiohttp.FormData()
+                    for filepath, filename, content_type in files:
+                        image_file = stack.enter_context(open(filepath, 'rb'))
+                        form.add_field(field, image_file, filename=filename, content_type=content_type)
+
+                    async with self._session.post(url, data=form) as response:
+                        if response.status not in self.RETRY_STATUSES or attempt >= self.retries:
+                            response.raise_for_status()  # Выбрасывает исключение для HTTP ошибок
+                            # Этапы nyuroprint попадают в Server-Timing этого запроса
+                            for name, seconds in parse_server_timing(response.headers.get("Server-Timing")):
+                                record(f"nyuroprint.{name}", seconds)
+                            return await response.json()
+                # Ждём уже после возврата соединения в пул
+                await self._sleep_before_retry(attempt)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    self.failures += 1
+                    raise
+                await self._sleep_before_retry(attempt)
+            except Exception:
+                self.failures += 1
+                raise
+
+        raise RuntimeError("Inference request retries exhausted")
+
+    async def _sleep_before_retry(self, attempt: int):
+        self.retried += 1
+        delay = self.backoff * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay))
+
+    def stats(self):
+        return {
+            "pool_limit": self.pool_limit,
+            "pool_waiting": self.pool_waiting,
+            "pool_waits": self.pool_waits,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "requests": self.requests,
+            "retried": self.retried,
+            "failures": self.failures
+        }
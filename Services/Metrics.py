@@ -0,0 +1,137 @@
+import os
+import time
+from contextlib import contextmanager
+from fastapi.responses import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from Services.Timing import record
+
+# С несколькими воркерами uvicorn каждый процесс пишет метрики в файлы этого каталога,
+# а /metrics собирает их вместе. Каталог должен быть пустым при старте сервиса.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Длительность HTTP-запросов",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Запросы, обрабатываемые в данный момент",
+    multiprocess_mode="livesum"
+)
+STAGE_LATENCY = Histogram(
+    "pipeline_stage_duration_seconds", "Длительность этапов обработки загрузки",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    "inference_batch_size", "Число изображений в одном запросе к nyuroprint",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Длительность SQL-запросов",
+    ["operation"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL-запросы, завершившиеся ошибкой", ["operation"])
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Замеряет длительность этапа обработки: with stage("upload_write"): ...
+
+    Длительность уходит в гистограмму и в заголовок Server-Timing текущего запроса.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(name).observe(elapsed)
+        record(name, elapsed)
+
+
+def _operation(statement: str) -> str:
+    # Метка — только первое слово запроса, чтобы число рядов оставалось ограниченным
+    return statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+
+
+def instrument_engine(engine):
+    """Подписывается на события SQLAlchemy и считает число и длительность запросов."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_LATENCY.labels(_operation(statement)).observe(elapsed)
+        record("db", elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        DB_QUERY_ERRORS.labels(_operation(context.statement)).inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: гистограмма длительности по шаблону маршрута и число запросов в работе.
+
+    Метка route — шаблон пути (/api/prints/{item_id}), а не сам путь, иначе
+    каждый id порождал бы новый временной ряд.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(scope["method"], self._route(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+    def _route(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None and hasattr(route, "path"):
+            return route.path
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._paths is None:
+            self._paths = {r.endpoint: r.path for r in scope["app"].routes if hasattr(r, "endpoint")}
+        return self._paths.get(endpoint, "unmatched")
+
+
+def metrics_response() -> Response:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        body = generate_latest(registry)
+    else:
+        body = generate_latest()
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,52 @@
+from typing import Optional, Sequence, Tuple
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from Services.Serialization import model_columns
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def parse_fields(fields: Optional[str], schema_cls) -> Optional[Tuple[str, ...]]:
+    """Разбирает параметр fields=a,b,c; неизвестные поля схемы дают 400."""
+    if not fields:
+        return None
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in schema_cls._declared_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+async def keyset_page(
+        session: AsyncSession,
+        model,
+        filters: Sequence = (),
+        fields: Optional[Tuple[str, ...]] = None,
+        after_id: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_SIZE
+):
+    """
+    Одна страница по ключу id: WHERE id > after_id ORDER BY id LIMIT limit.
+
+    Стоимость не зависит от номера страницы, в отличие от OFFSET. Выбираются только
+    колонки (все или из fields; id — всегда, он нужен для курсора) кортежами через Core,
+    без создания ORM-объектов. Возвращает (имена колонок, строки, next_cursor);
+    next_cursor равен None на последней странице.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    keys, columns = model_columns(model, fields)
+    query = select(*columns).filter(*filters)
+    if after_id is not None:
+        query = query.filter(model.id > after_id)
+    # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+    query = query.order_by(model.id).limit(limit + 1)
+
+    result = await session.execute(query)
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0]
+    return keys, rows, next_cursor
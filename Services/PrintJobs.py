@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+from fastapi import HTTPException
+from sqlalchemy import or_, select, update
+from Models.Blob import Blob
+from Models.Print import Print
+from Services.InferenceClient import InferenceClient
+from Services.Metrics import INFERENCE_BATCH_SIZE, stage
+from Services.ResultCache import result_cache
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow() -> datetime:
+    """Наивное UTC-время для колонки DateTime без часового пояса."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class PrintJob(NamedTuple):
+    print_id: int
+    filepath: str
+    filename: str
+    content_type: Optional[str]
+    content_hash: Optional[str]
+
+
+class PrintJobQueue:
+    """
+    Очередь фоновой обработки загрузок для асинхронного режима POST /api/prints/async.
+
+    Запрос только сохраняет файл и строку Print со статусом pending; пул из workers
+    корутин отправляет файлы в nyuroprint и заполняет defect. Очередь ограничена
+    max_queue заданиями, сверх этого новые задания отклоняются с 503.
+
+    Очередь живёт в памяти воркера, поэтому каждое незавершённое задание арендовано:
+    в строке Print записаны владелец (claimed_by) и время продления (claimed_at).
+    Пока воркер жив, он раз в lease / 3 секунд продлевает аренду своих строк и подбирает
+    через recover() строки, чья аренда истекла: владелец упал или был перезапущен.
+    Время берётся по часам воркеров, поэтому lease должен быть заметно больше их расхождения.
+    """
+
+    def __init__(
+            self,
+            session_factory,
+            workers: int = int(os.getenv("PRINT_JOB_WORKERS", "4")),
+            max_queue: int = int(os.getenv("PRINT_JOB_QUEUE", "1000")),
+            lease: float = float(os.getenv("PRINT_JOB_LEASE", "60"))
+    ):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.lease = lease
+        # Уникален для каждого запуска процесса: аренда не переживает рестарт
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks = []
+        self._inference_client: Optional[InferenceClient] = None
+
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+
+    async def start(self, inference_client: InferenceClient):
+        self._inference_client = inference_client
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def claim(self, new_print: Print):
+        """Записывает аренду в новую строку pending, принятую этим воркером."""
+        new_print.claimed_by = self.worker_id
+        new_print.claimed_at = utcnow()
+
+    def _expired(self, cutoff: datetime):
+        return (
+            Print.status.in_((Print.STATUS_PENDING, Print.STATUS_RECOVERING)),
+            or_(Print.claimed_at.is_(None), Print.claimed_at < cutoff)
+        )
+
+    async def recover(self) -> int:
+        """
+        Ставит в очередь задания с истёкшей арендой, не больше свободного места в очереди.
+
+        Строки забираются одним UPDATE ... RETURNING: id выбираются подзапросом
+        (в Postgres FOR UPDATE SKIP LOCKED), а условие истечения повторяется во внешнем
+        WHERE, поэтому строку, которую другой воркер успел продлить или забрать, этот
+        уже не тронет. Строки без аренды (созданные до её появления) считаются истёкшими.
+        Путь, хэш и тип файла восстанавливаются по img_path и таблице blob.
+        Возвращает число заданий.
+        """
+        capacity = self._queue.maxsize - self._queue.qsize()
+        if capacity <= 0:
+            return 0
+        now = utcnow()
+        expired = self._expired(now - timedelta(seconds=self.lease))
+        stale_ids = (
+            select(Print.id)
+            .where(*expired)
+            .order_by(Print.id)
+            .limit(capacity)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(Print)
+                .where(Print.id.in_(stale_ids), *expired)
+                .values(status=Print.STATUS_RECOVERING, claimed_by=self.worker_id, claimed_at=now)
+                .returning(Print.id, Print.img_path)
+                .execution_options(synchronize_session=False)
+            )
+            rows = result.all()
+            hashes = {}
+            if rows:
+                blobs = await session.execute(
+                    select(Blob.path, Blob.content_hash).where(Blob.path.in_({row.img_path for row in rows}))
+                )
+                hashes = dict(blobs.all())
+            await session.commit()
+
+        released = []
+        for row in rows:
+            filename = os.path.basename(row.img_path)
+            job = PrintJob(row.id, row.img_path, filename, mimetypes.guess_type(filename)[0],
+                           hashes.get(row.img_path))
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                # Очередь заполнили запросы, пока шёл UPDATE: строку заберёт следующий проход
+                released.append(row.id)
+        if released:
+            await self._release(released)
+        recovered = len(rows) - len(released)
+        if recovered:
+            self.recovered += recovered
+            logger.info(f"Recovered {recovered} print jobs with an expired lease")
+        return recovered
+
+    async def _release(self, print_ids):
+        async with self.session_factory() as session:
+            await session.execute(
+                update(Print)
+                .where(Print.id.in_(print_ids), Print.claimed_by == self.worker_id)
+                .values(claimed_by=None, claimed_at=None)
+            )
+            await session.commit()
+
+    async def _renew(self):
+        """Продлевает аренду всех незавершённых заданий этого воркера."""
+        async with self.session_factory() as session:
+            await session.execute(
+                update(Print)
+                .where(
+                    Print.claimed_by == self.worker_id,
+                    Print.status.in_((Print.STATUS_PENDING, Print.STATUS_RECOVERING))
+                )
+                .values(claimed_at=utcnow())
+            )
+            await session.commit()
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self._renew()
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Print job lease maintenance failed: {str(e)}")
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def enqueue(self, job: PrintJob):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Print job queue is full")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.error(f"Print job {job.print_id} failed: {str(e)}")
+                await self._finish(job.print_id, None, Print.STATUS_FAILED)
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: PrintJob):
+        with stage("inference"):
+            response_data = await self._inference_client.process_image(job.filepath, job.filename, job.content_type)
+        INFERENCE_BATCH_SIZE.observe(1)
+        defect = response_data.get('defect', False)
+        async with self.session_factory() as session:
+            if job.content_hash:
+                await result_cache.put(session, job.content_hash, response_data.get('model_version'), defect)
+            await self._update(session, job.print_id, defect, Print.STATUS_DONE)
+            with stage("db_commit"):
+                await session.commit()
+        self.completed += 1
+
+    async def _finish(self, print_id: int, defect: Optional[int], status: str):
+        try:
+            async with self.session_factory() as session:
+                await self._update(session, print_id, defect, status)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Could not update print {print_id}: {str(e)}")
+
+    @staticmethod
+    async def _update(session, print_id: int, defect: Optional[int], status: str):
+        await session.execute(
+            update(Print).where(Print.id == print_id).values(defect=defect, status=status)
+        )
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "recovered": self.recovered,
+            "completed": self.completed,
+            "failed": self.failed
+        }
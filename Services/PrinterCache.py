@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from Services.Serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class PrinterCache:
+    """
+    Кэш сериализованного каталога принтеров в памяти процесса.
+
+    Хранит готовое JSON-тело ответа и его ETag для списка и отдельных принтеров.
+    Сбрасывается при add_printer, и сброс рассылается остальным воркерам через
+    Postgres NOTIFY/LISTEN по каналу PRINTER_CACHE_CHANNEL. Записи живут не дольше ttl
+    секунд: если канал недоступен (SQLite, обрыв соединения слушателя), воркер отдаёт
+    устаревший каталог и 304 по старому ETag не дольше этого срока.
+    """
+
+    def __init__(self, max_entries: int = 256, channel: Optional[str] = None, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.channel = channel
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._listener = None
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    async def start(self, database_url: str):
+        """Подписывается на канал сброса кэша, если он настроен."""
+        if not self.channel or not database_url.startswith("postgresql"):
+            return
+        import asyncpg
+
+        dsn = database_url.replace("+asyncpg", "")
+        try:
+            self._listener = await asyncpg.connect(dsn)
+            await self._listener.add_listener(self.channel, self._on_notify)
+        except Exception as e:
+            # Без канала кэш остаётся рабочим, но сбрасывается только в своём воркере
+            logger.error(f"Printer cache listener is not available: {str(e)}")
+            self._listener = None
+
+    async def stop(self):
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.invalidate_local()
+
+    def invalidate_local(self):
+        self._generation += 1
+        self._entries.clear()
+
+    async def notify(self, session: AsyncSession):
+        """
+        Ставит в транзакцию уведомление остальным воркерам о сбросе кэша.
+
+        Вызывается до commit: Postgres доставляет NOTIFY только после фиксации транзакции,
+        а свой воркер после commit сбрасывается через invalidate_local().
+        """
+        if self.channel and session.bind.dialect.name == "postgresql":
+            await session.execute(text("SELECT pg_notify(:channel, '')"), {"channel": self.channel})
+
+    @staticmethod
+    def _etag(body: bytes) -> str:
+        return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    @staticmethod
+    def _matches(request: Request, etag: str) -> bool:
+        header = request.headers.get("if-none-match")
+        if not header:
+            return False
+        candidates = [tag.strip() for tag in header.split(",")]
+        return "*" in candidates or etag in candidates
+
+    async def respond(self, request: Request, key: Hashable, build: Callable[[], Awaitable[dict]]) -> Response:
+        """Отдаёт закэшированное тело (или 304 по If-None-Match), при промахе строит его через build()."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            generation = self._generation
+            body = dumps(await build())
+            entry = (body, self._etag(body), time.monotonic() + self.ttl)
+            # Каталог мог измениться, пока мы читали его из базы
+            if generation == self._generation:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        body, etag, _ = entry
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if self._matches(request, etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "ttl": self.ttl,
+            "cross_worker": self._listener is not None
+        }
+
+
+printer_cache = PrinterCache(
+    max_entries=int(os.getenv("PRINTER_CACHE_SIZE", "256")),
+    # Пустое значение отключает рассылку сброса между воркерами
+    channel=os.getenv("PRINTER_CACHE_CHANNEL", "printer_cache") or None,
+    # Срок жизни записи, секунды: страховка на случай недоставленного сброса
+    ttl=float(os.getenv("PRINTER_CACHE_TTL", "30"))
+)
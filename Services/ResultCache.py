@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+from collections import Counter, OrderedDict
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from Models.PredictionCache import PredictionCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    Кэш предсказаний по хэшу содержимого загрузки и версии модели.
+
+    Первый уровень — LRU в памяти процесса, второй (необязательный) — таблица prediction_cache.
+    Версия модели берётся из MODEL_VERSION, иначе из /readyz nyuroprint при старте
+    (и повторно, пока сервис не готов), а дальше — из каждого ответа инференса.
+    Пока версия неизвестна, кэш не используется.
+
+    Попадания считаются в памяти и раз в flush_interval секунд одной транзакцией
+    добавляются к prediction_cache.hits, а не пишутся в транзакции запроса.
+    """
+
+    def __init__(self, max_entries: int = 4096, persistent: bool = True, flush_interval: float = 10.0):
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.flush_interval = flush_interval
+        self.model_version: Optional[str] = os.getenv("MODEL_VERSION") or None
+        self._entries = OrderedDict()
+        self._pending_hits = Counter()
+        self._session_factory = None
+        self._inference_client = None
+        self._flusher = None
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self, session_factory, inference_client=None):
+        self._session_factory = session_factory
+        self._inference_client = inference_client
+        await self._refresh_model_version()
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def _refresh_model_version(self):
+        if self.model_version is not None or self._inference_client is None:
+            return
+        try:
+            self.model_version = await self._inference_client.model_version() or self.model_version
+        except Exception as e:
+            logger.warning(f"Model version is not available yet: {str(e)}")
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._refresh_model_version()
+            await self.flush()
+
+    async def flush(self):
+        """Добавляет накопленные попадания к prediction_cache.hits; при ошибке они вернутся в счётчик."""
+        if not self._pending_hits or self._session_factory is None:
+            return
+        pending, self._pending_hits = self._pending_hits, Counter()
+        try:
+            async with self._session_factory() as session:
+                # Одинаковый порядок строк во всех воркерах, чтобы их транзакции не взаимоблокировались
+                for (content_hash, model_version), count in sorted(pending.items()):
+                    await session.execute(
+                        update(PredictionCache)
+                        .where(PredictionCache.content_hash == content_hash,
+                               PredictionCache.model_version == model_version)
+                        .values(hits=PredictionCache.hits + count)
+                    )
+                await session.commit()
+        except Exception as e:
+            self._pending_hits.update(pending)
+            logger.error(f"Could not flush result cache hits: {str(e)}")
+
+    def _remember(self, key, defect: int):
+        self._entries[key] = defect
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, session: AsyncSession, content_hash: str) -> Optional[int]:
+        """Возвращает закэшированный defect и отмечает попадание; None при промахе."""
+        if self.model_version is None:
+            self.misses += 1
+            return None
+
+        key = (content_hash, self.model_version)
+        defect = self._entries.get(key)
+        if defect is not None:
+            self._entries.move_to_end(key)
+        elif self.persistent:
+            result = await session.execute(
+                select(PredictionCache.defect).filter(
+                    PredictionCache.content_hash == content_hash,
+                    PredictionCache.model_version == self.model_version
+                )
+            )
+            defect = result.scalar_one_or_none()
+            if defect is not None:
+                self._remember(key, defect)
+
+        if defect is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self.persistent:
+            self._pending_hits[key] += 1
+        return defect
+
+    async def put(self, session: AsyncSession, content_hash: str, model_version: Optional[str], defect: int):
+        """Запоминает результат инференса; версия модели из ответа становится текущей."""
+        if not model_version:
+            return
+        self.model_version = model_version
+        self._remember((content_hash, model_version), defect)
+
+        if self.persistent:
+            try:
+                # Тот же файл мог параллельно обработать другой воркер
+                async with session.begin_nested():
+                    session.add(PredictionCache(
+                        content_hash=content_hash,
+                        model_version=model_version,
+                        defect=defect,
+                        hits=0
+                    ))
+            except IntegrityError:
+                pass
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "pending_hits": sum(self._pending_hits.values()),
+            "model_version": self.model_version
+        }
+
+
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "4096")),
+    persistent=os.getenv("RESULT_CACHE_PERSISTENT", "1") == "1",
+    flush_interval=float(os.getenv("RESULT_CACHE_FLUSH_INTERVAL", "10"))
+)
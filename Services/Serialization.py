@@ -0,0 +1,32 @@
+from typing import Optional, Sequence
+import orjson
+from fastapi.responses import Response
+
+
+def model_columns(model, fields: Optional[Sequence[str]] = None):
+    """
+    Колонки модели для выборки кортежами через Core.
+
+    id всегда идёт первым: по нему строится курсор пагинации. Служебные колонки
+    (info={"internal": True}) в ответы API по умолчанию не попадают.
+    """
+    if fields:
+        keys = ["id"] + [f for f in fields if f != "id"]
+    else:
+        keys = [column.key for column in model.__table__.columns if not column.info.get("internal")]
+    return keys, [getattr(model, key) for key in keys]
+
+
+def rows_to_dicts(keys: Sequence[str], rows) -> list:
+    """Строки-кортежи в словари без ORM-объектов и схем marshmallow."""
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def dumps(payload) -> bytes:
+    return orjson.dumps(payload)
+
+
+def json_response(payload, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    """Готовый Response: FastAPI не прогоняет тело через jsonable_encoder."""
+    return Response(content=dumps(payload), status_code=status_code, media_type="application/json",
+                    headers=headers)
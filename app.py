@@ -1,33 +1,62 @@
+import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, Depends, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Depends, Form, HTTPException, Request, Query
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 import uvicorn
-from Controllers.PrinterController import PrinterController
+from Controllers.PrinterController import PrinterController, PrinterCreate
 from Controllers.PrintController import PrintController
 from Models.Printer import Printer
 from Models.Print import Print
-from database import DataBase, AsyncSessionLocal, engine, get_db  # Импортируйте engine и AsyncSessionLocal
+from Models.PredictionCache import PredictionCache
+from Models.Blob import Blob
+from Services.ResultCache import result_cache
+from Services.InferenceClient import InferenceClient
+from Services.PrintJobs import PrintJobQueue
+from Services.Pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from Services.PrinterCache import printer_cache
+from Services.Serialization import json_response
+from Services.Metrics import MetricsMiddleware, instrument_engine, metrics_response
+from Services.Timing import ServerTimingMiddleware
+from database import DataBase, AsyncSessionLocal, engine, get_db, DATABASE_URL, DB_MIGRATE_ON_STARTUP  # Импортируйте engine и AsyncSessionLocal
+from migrate import migrate
 from fastapi.responses import JSONResponse
 
 
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+
+# Число и длительность SQL-запросов для /metrics
+instrument_engine(engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        # Create all tables
-        await conn.run_sync(DataBase.metadata.create_all)
+    # В контейнере схему один раз мигрирует migrate.py до запуска воркеров
+    if DB_MIGRATE_ON_STARTUP:
+        await migrate()
+
+    # Сброс кэша каталога принтеров между воркерами
+    await printer_cache.start(DATABASE_URL)
+
+    # Один клиент с пулом keep-alive соединений на весь процесс
+    app.state.inference_client = InferenceClient()
+    await app.state.inference_client.start()
+
+    # Версия модели для кэша результатов и периодическая запись счётчиков попаданий
+    await result_cache.start(AsyncSessionLocal, app.state.inference_client)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Printer))
-        if not result.scalars().first():
-            await PrinterController.create_default_printers(session)
-        await session.commit()
+    # Фоновый пул для асинхронного режима загрузки
+    app.state.print_jobs = PrintJobQueue(AsyncSessionLocal)
+    await app.state.print_jobs.start(app.state.inference_client)
+    # Задания упавших или перезапущенных воркеров; дальше recover() идёт по таймеру аренды
+    await app.state.print_jobs.recover()
 
     yield
 
+    await app.state.print_jobs.stop()
+    await result_cache.stop()
+    await app.state.inference_client.close()
+    await printer_cache.stop()
     await engine.dispose()
 
 # Создаем приложение FastAPI с жизненным циклом
@@ -42,6 +71,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Длительность запросов по маршрутам и число запросов в работе
+app.add_middleware(MetricsMiddleware)
+# Server-Timing по этапам запроса и выборочный лог медленных запросов
+app.add_middleware(ServerTimingMiddleware)
+
 # Middleware для CSP
 @app.middleware("http")
 async def add_csp_header(request, call_next):
@@ -56,39 +90,118 @@ async def add_csp_header(request, call_next):
 
 # Роуты для принтеров
 @app.get("/api/printers/")
-async def get_printers(session: AsyncSession = Depends(get_db)):
-    return await PrinterController.get_printers(session)
+async def get_printers(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[int] = None,  # Курсор: id последнего принтера предыдущей страницы
+    fields: Optional[str] = None,     # Проекция: fields=id,name
+    session: AsyncSession = Depends(get_db)
+):
+    # Каталог почти не меняется: тело ответа берётся из кэша, клиент получает ETag
+    return await printer_cache.respond(
+        request,
+        ("list", limit, after_id, fields),
+        lambda: PrinterController.get_printers(session, limit, after_id, fields)
+    )
 
 @app.post("/api/printers/")
-async def add_printer(session: AsyncSession = Depends(get_db)):
-    return await PrinterController.add_printer(session)
+async def add_printer(printer_data: PrinterCreate, session: AsyncSession = Depends(get_db)):
+    return await PrinterController.add_printer(session, printer_data)
 
 @app.get("/api/printers/{item_id}")
-async def get_printer(item_id: int, session: AsyncSession = Depends(get_db)):
-    return await PrinterController.get_printer(session, item_id)
+async def get_printer(request: Request, item_id: int, session: AsyncSession = Depends(get_db)):
+    return await printer_cache.respond(
+        request,
+        ("item", item_id),
+        lambda: PrinterController.get_printer(session, item_id)
+    )
 
 # Роуты для печати
 @app.get("/api/prints/")
-async def get_prints(session: AsyncSession = Depends(get_db)):
-    return await PrintController.get_prints(session)
+async def get_prints(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[int] = None,  # Курсор: next_cursor из предыдущего ответа
+    printer_id: Optional[int] = None,
+    defect: Optional[int] = None,
+    quality: Optional[int] = None,
+    fields: Optional[str] = None,     # Проекция: fields=id,defect
+    session: AsyncSession = Depends(get_db)
+):
+    return json_response(
+        await PrintController.get_prints(session, limit, after_id, printer_id, defect, quality, fields)
+    )
 
 @app.post("/api/prints/")
 async def add_print(
+    request: Request,
     img: UploadFile,
     printer_id: int = Form(...),  # Добавлено получение printer_id из формы
     quality: int = Form(...),      # Добавлено получение quality из формы
     session: AsyncSession = Depends(get_db)
 ):
     try:
-        response = await PrintController.add_print(img, printer_id, quality, session, UPLOAD_FOLDER)
+        response = await PrintController.add_print(
+            img, printer_id, quality, session, UPLOAD_FOLDER, request.app.state.inference_client
+        )
         return JSONResponse(content=response, status_code=201)  # Успешный ответ с кодом 201
     except HTTPException as http_ex:
         raise http_ex  # Повторно выбрасываем HTTP исключения
     except Exception as ex:
         return JSONResponse(content={"message": str(ex)}, status_code=500)  # Обработка общих исключений
 
+@app.post("/api/prints/batch")
+async def add_prints_batch(
+    request: Request,
+    imgs: List[UploadFile] = File(...),
+    printer_id: int = Form(...),
+    quality: int = Form(...),
+    session: AsyncSession = Depends(get_db)
+):
+    response = await PrintController.add_prints_batch(
+        imgs, printer_id, quality, session, UPLOAD_FOLDER, request.app.state.inference_client
+    )
+    return JSONResponse(content=response, status_code=201)
+
+@app.post("/api/prints/async")
+async def add_print_async(
+    request: Request,
+    img: UploadFile,
+    printer_id: int = Form(...),
+    quality: int = Form(...),
+    session: AsyncSession = Depends(get_db)
+):
+    response = await PrintController.add_print_async(
+        img, printer_id, quality, session, UPLOAD_FOLDER, request.app.state.print_jobs
+    )
+    # 202: задание принято, результат появится в GET /api/prints/{print_id}
+    return JSONResponse(
+        content=response,
+        status_code=202,
+        headers={"Location": f"/api/prints/{response['print_id']}"}
+    )
+
+@app.get("/api/stats/print_jobs")
+async def get_print_jobs_stats(request: Request):
+    return request.app.state.print_jobs.stats()
+
+@app.get("/api/stats/printer_cache")
+async def get_printer_cache_stats():
+    return printer_cache.stats()
+
+@app.get("/api/stats/result_cache")
+async def get_result_cache_stats():
+    return result_cache.stats()
+
+@app.get("/api/stats/inference_client")
+async def get_inference_client_stats(request: Request):
+    return request.app.state.inference_client.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics_response()
+
 @app.get("/api/prints/{item_id}")
 async def get_print(item_id: int, session: AsyncSession = Depends(get_db)):
-    return await PrintController.get_print(session, item_id)
+    return json_response(await PrintController.get_print(session, item_id))
 
 
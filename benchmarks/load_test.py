@@ -0,0 +1,344 @@
+"""
+Нагрузочный замер веб-сервиса от HTTP до базы.
+
+Поднимает заглушку nyuroprint (benchmarks.stub_inference) и app.py под uvicorn
+с базой SQLite во временном каталоге (или с --database-url), затем по очереди
+гоняет сценарии с заданной конкурентностью:
+
+    upload         POST /api/prints/ с изображениями из uploads/
+    list_prints    GET /api/prints/
+    list_printers  GET /api/printers/
+
+Для каждого сценария считаются p50/p95/p99, среднее, пропускная способность и ошибки,
+для каждого процесса сервера — пиковый RSS. Результат пишется в JSON вместе с хэшем
+коммита, чтобы прогоны разных коммитов можно было сравнить через --compare.
+
+Для SQLite нужен aiosqlite (pip install aiosqlite). Запуск из корня репозитория:
+    python -m benchmarks.load_test --concurrency 16 --requests 500 --stub-latency-ms 50
+    python -m benchmarks.load_test --compare benchmarks/results/load-<commit>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+import aiohttp
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SCENARIOS = ("upload", "list_prints", "list_printers")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_images(folder: str):
+    images = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(root, name), "rb") as f:
+                    images.append((name, f.read()))
+    if not images:
+        raise SystemExit(f"No images found in {folder}")
+    return images
+
+
+def process_tree(pid: int):
+    """pid и все его потомки по /proc (воркеры uvicorn — дочерние процессы)."""
+    pids = [pid]
+    for current in pids:
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """Периодически снимает RSS всех процессов сервера и запоминает пик по каждому."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = {}
+        self._task = None
+
+    def sample(self):
+        for pid in process_tree(self.pid):
+            value = rss_mb(pid)
+            if value is not None:
+                self.peak[pid] = max(self.peak.get(pid, 0.0), value)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.sample()
+
+    def report(self):
+        return {str(pid): round(value, 1) for pid, value in sorted(self.peak.items())}
+
+
+def launch(args, workdir: str):
+    """Поднимает заглушку инференса и веб-сервис; возвращает (base_url, процессы)."""
+    stub_port, web_port = free_port(), free_port()
+    database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}"
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_inference", "--port", str(stub_port),
+         "--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms)],
+        cwd=REPO_ROOT
+    )
+    metrics_dir = os.path.join(workdir, "metrics")
+    os.makedirs(metrics_dir)
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        DATABASE_ECHO="0",
+        NYUROPRINT_URL=f"http://127.0.0.1:{stub_port}",
+        UPLOAD_FOLDER=os.path.join(workdir, "uploads"),
+        PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+    )
+    web = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(web_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=env
+    )
+    return f"http://127.0.0.1:{web_port}", [web, stub]
+
+
+async def wait_ready(session: aiohttp.ClientSession, base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f"{base_url}/api/printers/?limit=1") as response:
+                if response.status == 200:
+                    return (await response.json())["data"]
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() >= deadline:
+            raise SystemExit(f"Server at {base_url} did not become ready")
+        await asyncio.sleep(0.5)
+
+
+def make_upload(images, printer_id: int, unique: bool):
+    async def request(session, base_url, i):
+        name, data = random.choice(images)
+        if unique:
+            # Хвост после конца изображения декодеры игнорируют, а хэш становится новым,
+            # поэтому каждая загрузка проходит через инференс, а не через кэш результатов
+            data = data + os.urandom(16)
+        form = aiohttp.FormData()
+        form.add_field("img", data, filename=name, content_type="image/jpeg")
+        form.add_field("printer_id", str(printer_id))
+        form.add_field("quality", str(random.randint(1, 5)))
+        async with session.post(f"{base_url}/api/prints/", data=form) as response:
+            await response.read()
+            return response.status
+    return request
+
+
+def make_get(path: str):
+    async def request(session, base_url, i):
+        async with session.get(f"{base_url}{path}") as response:
+            await response.read()
+            return response.status
+    return request
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(session, base_url, request, concurrency: int, total: int, warmup: int):
+    for i in range(warmup):
+        await request(session, base_url, i)
+
+    latencies = []
+    statuses = Counter()
+    indices = iter(range(total))
+
+    async def worker():
+        for i in indices:
+            started = time.perf_counter()
+            try:
+                status = await request(session, base_url, i)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[str(status)] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": total,
+        "errors": total - ok,
+        "statuses": dict(statuses),
+        "throughput_rps": round(total / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+def print_report(results, previous=None):
+    print(f"{'scenario':<14} {'rps':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9} {'errors':>7}")
+    for name, summary in results["scenarios"].items():
+        line = (f"{name:<14} {summary['throughput_rps']:>8.1f} {summary['p50_ms']:>9.1f} "
+                f"{summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f} {summary['errors']:>7}")
+        old = (previous or {}).get("scenarios", {}).get(name)
+        if old:
+            line += (f"   vs {previous['commit']}: rps {summary['throughput_rps'] / old['throughput_rps'] - 1:+.1%},"
+                     f" p95 {summary['p95_ms'] / old['p95_ms'] - 1:+.1%}")
+        print(line)
+    if results.get("rss_mb"):
+        print("peak RSS, MB: " + ", ".join(f"pid {pid}: {mb}" for pid, mb in results["rss_mb"].items()))
+
+
+async def run(args):
+    images = load_images(args.images)
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    processes = []
+    base_url = args.base_url
+    if base_url is None:
+        base_url, processes = launch(args, workdir)
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    sampler = None
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            printers = await wait_ready(session, base_url)
+            if not printers:
+                raise SystemExit("No printers in the database")
+            if processes:
+                sampler = MemorySampler(processes[0].pid)
+                sampler.start()
+
+            requests = {
+                "upload": make_upload(images, printers[0]["id"], args.unique),
+                "list_prints": make_get(f"/api/prints/?limit={args.page_size}"),
+                "list_printers": make_get(f"/api/printers/?limit={args.page_size}"),
+            }
+            scenarios = {}
+            for name in args.scenarios:
+                scenarios[name] = await run_scenario(
+                    session, base_url, requests[name], args.concurrency, args.requests, args.warmup
+                )
+            if sampler is not None:
+                await sampler.stop()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "base_url": args.base_url,
+            "database": "external" if args.base_url else (args.database_url or "sqlite"),
+            "workers": None if args.base_url else args.workers,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "unique_uploads": args.unique,
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_jitter_ms": args.stub_jitter_ms,
+            "images": len(images),
+        },
+        "scenarios": scenarios,
+        "rss_mb": sampler.report() if sampler is not None else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Нагружать уже запущенный сервис вместо локального")
+    parser.add_argument("--database-url", help="По умолчанию SQLite во временном каталоге")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="Запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=10, help="Запросов прогрева на сценарий, не учитываются")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--images", default=os.path.join(REPO_ROOT, "uploads"))
+    parser.add_argument("--unique", action=argparse.BooleanOptionalAction, default=True,
+                        help="Делать каждую загрузку уникальной, чтобы обойти кэш результатов")
+    parser.add_argument("--stub-latency-ms", type=float, default=50.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", dest="json_path", help="По умолчанию benchmarks/results/load-<commit>.json")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(results, previous)
+
+    json_path = args.json_path or os.path.join(RESULTS_DIR, f"load-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+    with open(json_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
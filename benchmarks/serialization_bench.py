@@ -0,0 +1,94 @@
+"""
+Микробенчмарк сериализации списка принтеров.
+
+Сравнивает прежний путь (ORM-объекты -> PrinterSchema(many=True).dump -> jsonable_encoder -> json)
+с быстрым (кортежи через Core -> dict(zip) -> orjson) на таблице из 1k, 10k и 100k строк
+в SQLite в памяти.
+
+Запуск из корня репозитория:
+    python -m benchmarks.serialization_bench --sizes 1000 10000 100000 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import time
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Boolean, Float, Integer, create_engine, insert, select
+from sqlalchemy.orm import Session
+from Models.Printer import Printer, PrinterSchema
+from Services.Serialization import dumps, model_columns, rows_to_dicts
+
+
+def synthetic_row(i: int) -> dict:
+    row = {}
+    for column in Printer.__table__.columns:
+        if column.key == "id":
+            continue
+        if isinstance(column.type, Float):
+            row[column.key] = i * 0.5
+        elif isinstance(column.type, Integer):
+            row[column.key] = i % 4
+        elif isinstance(column.type, Boolean):
+            row[column.key] = i % 2 == 0
+        else:
+            row[column.key] = f"{column.key}-{i}"
+    return row
+
+
+def seed(rows: int):
+    engine = create_engine("sqlite://")
+    Printer.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Printer), [synthetic_row(i) for i in range(rows)])
+    return engine
+
+
+def marshmallow_path(engine) -> bytes:
+    with Session(engine) as session:
+        printers = session.execute(select(Printer)).scalars().all()
+        payload = {"message": "OK", "data": PrinterSchema(many=True).dump(printers)}
+        return json.dumps(jsonable_encoder(payload)).encode()
+
+
+def compiled_path(engine) -> bytes:
+    keys, columns = model_columns(Printer)
+    with engine.connect() as conn:
+        rows = conn.execute(select(*columns)).all()
+    return dumps({"message": "OK", "data": rows_to_dicts(keys, rows)})
+
+
+def measure(fn, engine, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(engine)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'rows':>8} {'marshmallow, ms':>16} {'compiled, ms':>13} {'speedup':>8}")
+    for size in args.sizes:
+        engine = seed(size)
+        # Оба пути должны давать один и тот же документ
+        assert json.loads(marshmallow_path(engine)) == json.loads(compiled_path(engine))
+        slow = measure(marshmallow_path, engine, args.repeat)
+        fast = measure(compiled_path, engine, args.repeat)
+        engine.dispose()
+        results.append({"rows": size, "marshmallow_ms": slow, "compiled_ms": fast, "speedup": slow / fast})
+        print(f"{size:>8} {slow:>16.1f} {fast:>13.1f} {slow / fast:>7.1f}x")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Заглушка сервиса nyuroprint для нагрузочных замеров веб-сервиса.
+
+Отвечает на /process_images, /process_images_batch и /readyz тем же форматом, что и настоящий
+сервис, но вместо модели ждёт заданное время. defect детерминирован по хэшу файла,
+поэтому повторная загрузка даёт тот же ответ.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stub_inference --port 3001 --latency-ms 50 --jitter-ms 10
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+from typing import List
+import uvicorn
+from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import JSONResponse
+
+# Задержка «инференса» одного запроса и её случайный разброс
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "50"))
+STUB_JITTER_MS = float(os.getenv("STUB_JITTER_MS", "0"))
+# Доля запросов, на которые заглушка отвечает 503, чтобы проверить повторы клиента
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+
+MODEL_VERSION = "stub"
+
+app = FastAPI()
+
+
+async def _wait():
+    delay = STUB_LATENCY_MS + random.uniform(-STUB_JITTER_MS, STUB_JITTER_MS)
+    await asyncio.sleep(max(0.0, delay) / 1000)
+
+
+async def _defect(image: UploadFile) -> int:
+    digest = hashlib.sha256(await image.read()).digest()
+    return digest[0] % 4
+
+
+@app.post("/process_images")
+async def process_images(image: UploadFile = File(...)):
+    if random.random() < STUB_ERROR_RATE:
+        return JSONResponse(content={"detail": "Stub overloaded"}, status_code=503)
+    defect = await _defect(image)
+    await _wait()
+    return {"message": "Images processed successfully", "defect": defect,
+            "model_version": MODEL_VERSION, "cached": False}
+
+
+@app.post("/process_images_batch")
+async def process_images_batch(images: List[UploadFile] = File(...)):
+    if random.random() < STUB_ERROR_RATE:
+        return JSONResponse(content={"detail": "Stub overloaded"}, status_code=503)
+    results = [{"filename": image.filename, "defect": await _defect(image), "cached": False} for image in images]
+    # Батч обрабатывается одним вызовом модели, поэтому задержка одна на весь запрос
+    await _wait()
+    return {"message": "Images processed successfully", "model_version": MODEL_VERSION, "results": results}
+
+
+@app.get("/readyz")
+async def readyz():
+    return {"status": "ready", "model_version": MODEL_VERSION}
+
+
+def main():
+    global STUB_LATENCY_MS, STUB_JITTER_MS, STUB_ERROR_RATE
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--latency-ms", type=float, default=STUB_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=STUB_JITTER_MS)
+    parser.add_argument("--error-rate", type=float, default=STUB_ERROR_RATE)
+    args = parser.parse_args()
+
+    STUB_LATENCY_MS, STUB_JITTER_MS, STUB_ERROR_RATE = args.latency_ms, args.jitter_ms, args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
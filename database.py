@@ -1,16 +1,78 @@
+import os
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Определение базового класса
 DataBase = declarative_base()
 
-DATABASE_URL = "postgresql+asyncpg://root:root@db:5432/PrintersProject"
+# Для локальных замеров можно указать, например, sqlite+aiosqlite:///bench.db
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://root:root@db:5432/PrintersProject")
+# Логирование каждого SQL-запроса; под нагрузкой само по себе заметно тормозит
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "1") == "1"
 
 # Создаем асинхронный движок и сессию
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=DATABASE_ECHO)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 # Функция для получения сессии
 async def get_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+# Ключ межпроцессной блокировки миграции схемы в Postgres
+SCHEMA_LOCK_KEY = 0x6e797572
+# Мигрировать схему при старте каждого воркера; в контейнере миграцию один раз
+# выполняет migrate.py до запуска uvicorn, и здесь она отключена
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1"
+
+
+def _lock_schema(connection):
+    """Одновременно стартующие мигрирующие процессы выполняются по очереди до конца транзакции."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+
+def _sync_schema(connection):
+    """
+    Дополняет уже существующие таблицы новыми колонками и индексами моделей.
+
+    create_all создаёт только отсутствующие таблицы, поэтому колонки и индексы,
+    добавленные в модели позже, досоздаются здесь. DDL (тип, DEFAULT, NOT NULL)
+    компилирует SQLAlchemy; в Postgres используется IF NOT EXISTS.
+    """
+    inspector = inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    if_not_exists = "IF NOT EXISTS " if connection.dialect.name == 'postgresql' else ""
+    for table in DataBase.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name']: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {if_not_exists}{column_ddl}"
+                ))
+            elif column.nullable and not existing[column.name]['nullable'] \
+                    and connection.dialect.name == 'postgresql':
+                connection.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ALTER COLUMN {quote(column.name)} DROP NOT NULL"
+                ))
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+async def create_schema(connection=None):
+    """Создаёт и дополняет схему под блокировкой; с connection — в транзакции вызывающего."""
+    if connection is None:
+        async with engine.begin() as conn:
+            await create_schema(conn)
+        return
+    await connection.run_sync(_lock_schema)
+    await connection.run_sync(DataBase.metadata.create_all)
+    await connection.run_sync(_sync_schema)
@@ -0,0 +1,56 @@
+"""
+Миграция схемы базы и начальные данные.
+
+Запускается один раз до старта воркеров uvicorn (см. CMD в Dockerfile), чтобы десять
+воркеров не мигрировали схему одновременно. Без контейнера то же самое делает
+lifespan приложения при DB_MIGRATE_ON_STARTUP=1; в Postgres оба пути выполняются
+под pg_advisory_xact_lock и не мешают друг другу.
+
+Запуск из корня репозитория:
+    python migrate.py
+"""
+import asyncio
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from Controllers.PrinterController import PrinterController
+from Models.Printer import Printer
+from Models.Print import Print  # noqa: F401 — модели регистрируются в DataBase.metadata
+from Models.PredictionCache import PredictionCache  # noqa: F401
+from Models.Blob import Blob  # noqa: F401
+from database import engine, create_schema
+
+logger = logging.getLogger(__name__)
+
+# База в docker-compose стартует параллельно с приложением
+CONNECT_ATTEMPTS = 30
+
+
+async def migrate():
+    """Схема и принтеры по умолчанию в одной транзакции под блокировкой схемы."""
+    async with engine.begin() as conn:
+        await create_schema(conn)
+        session = AsyncSession(bind=conn)
+        result = await session.execute(select(Printer.id).limit(1))
+        if result.scalar_one_or_none() is None:
+            # commit сессии здесь не завершает внешнюю транзакцию engine.begin()
+            await PrinterController.create_default_printers(session)
+
+
+async def main():
+    for attempt in range(1, CONNECT_ATTEMPTS + 1):
+        try:
+            await migrate()
+            break
+        except (OSError, ConnectionError) as e:
+            if attempt == CONNECT_ATTEMPTS:
+                raise
+            logger.warning(f"Database is not available yet ({str(e)}), retrying")
+            await asyncio.sleep(2)
+    await engine.dispose()
+    print("Database schema is up to date")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
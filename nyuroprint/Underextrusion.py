@@ -1,41 +1,24 @@
-import tensorflow as tf
 import numpy as np
-from PIL import Image, ImageOps
 import os
+import functools
+import time
 import asyncio
-from tensorflow.python.compiler.tensorrt import trt_convert as trt
 import aiofiles
-import shutil
-cache_path = "/tmp/tensorrt/"
-if os.path.exists(cache_path):
-    shutil.rmtree(cache_path)
-    print("Cleared TensorRT cache.")
+
+import backends
+import model_store
+import pipeline
+
 
 class UnderextrusionDetector:
-    def __init__(self, model_path="tensorrt_optimized_model", labels_path="labels.txt"):
-        # Удаляем старую оптимизированную модель, если она существует
-        optimized_model_path = model_path + "_optimized"
-
-        # Инициализация конвертера TensorRT
-        self.converter = trt.TrtGraphConverterV2(
-            input_saved_model_dir=model_path,
-            precision_mode=trt.TrtPrecisionMode.FP16,
-            use_calibration=True,
-            allow_build_at_runtime=True
-        )
-
-        # Конвертация и сохранение модели
-        print("Converting model to TensorRT...")
-        self.converter.convert()
-
-        # Сохранение оптимизированной модели
-        print("Saving optimized model...")
-        self.converter.save(optimized_model_path)
-
-        # Загрузка оптимизированной модели
-        print("Loading optimized model...")
-        self.model = tf.saved_model.load(optimized_model_path)
-        self.predict_fn = self.model.signatures['serving_default']
+    def __init__(self, model_path=model_store.MODEL_SOURCE, labels_path="labels.txt", backend=None):
+        # Артефакт собирается один раз и кэшируется под отпечатком исходной модели
+        self.backend = backend or model_store.default_backend()
+        print(f"Preparing {self.backend} model artifact...")
+        artifact_path, self.model_version = model_store.ensure_artifact(self.backend, source_dir=model_path)
+
+        print(f"Loading model from {artifact_path}...")
+        self.engine = backends.load_backend(self.backend, artifact_path)
 
         # Загрузка меток классов
         print("Loading class labels...")
@@ -49,52 +32,86 @@ class UnderextrusionDetector:
         data = self.preprocess_image(image_path)
         data = np.expand_dims(data, axis=0)
 
+        return self.predict_batch(data, confidence_threshold)[0]
+
+    def warmup(self, batch_sizes):
+        """
+        Прогоняет синтетические батчи каждого размера, который может собрать планировщик.
+
+        Первые вызовы графа компилируют ядра, а TF-TRT с allow_build_at_runtime строит
+        движок под каждую новую форму входа; после прогрева этого не происходит на запросах.
+        Возвращает время первого вызова по размерам батча в мс. Ошибки не подавляются.
+        """
+        timings = {}
+        for batch_size in batch_sizes:
+            batch = np.zeros((batch_size, *model_store.INPUT_SHAPE), dtype=np.float32)
+            started = time.perf_counter()
+            self.engine.predict(batch)
+            timings[batch_size] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"Model warmed up: {timings}")
+        return timings
+
+    def predict_batch(self, batch, confidence_threshold=0.5):
+        """Предсказание для батча уже предобработанных изображений формы (N, 224, 224, 3)."""
+
         # Выполнение предсказания
         try:
-            predictions = self.predict_fn(tf.constant(data))
-            output = next(iter(predictions.values())).numpy().flatten()
+            outputs = np.asarray(self.engine.predict(batch)).reshape(len(batch), -1)
+        except Exception as e:
+            print(f"ошибка предсказания {str(e)}")
+            return [{
+                'status': 'error',
+                'message': f'Prediction failed: {str(e)}'
+            }] * len(batch)
 
-            # Получение индекса класса и уверенности
-            confidence = float(np.max(output))
-            class_index = np.argmax(output)
+        return [self._format_prediction(output, confidence_threshold) for output in outputs]
 
-            if confidence < confidence_threshold:
-                return {
-                    'status': 'low_confidence',
-                    'confidence': confidence,
-                    'message': 'Prediction confidence too low'
-                }
+    def _format_prediction(self, output, confidence_threshold):
+        # Получение индекса класса и уверенности
+        confidence = float(np.max(output))
+        class_index = np.argmax(output)
 
+        if confidence < confidence_threshold:
             return {
-                'status': 'success',
-                'class_name': self.class_names[class_index],
+                'status': 'low_confidence',
                 'confidence': confidence,
-                'predictions': {
-                    self.class_names[i]: float(output[i])
-                    for i in range(len(self.class_names))
-                }
+                'message': 'Prediction confidence too low'
             }
 
-        except Exception as e:
-            print(f"ошибка предсказания {str(e)}")
-            return {
-                'status': 'error',
-                'message': f'Prediction failed: {str(e)}'
+        return {
+            'status': 'success',
+            'class_name': self.class_names[class_index],
+            'confidence': confidence,
+            'predictions': {
+                self.class_names[i]: float(output[i])
+                for i in range(len(self.class_names))
             }
+        }
 
-    def preprocess_image(self, image_path):
+    @staticmethod
+    def preprocess_image(image_path):
         """Предобработка изображения для модели."""
         try:
-            size = (224, 224)
-            image = Image.open(image_path).convert("RGB")
-            image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
-            image_array = np.asarray(image).astype(np.float32)
-            normalized_image_array = (image_array / 127.5) - 1
-            return normalized_image_array
+            image = pipeline.decode_image(image_path)
+            return pipeline.normalize(pipeline.resize_image(image))
         except Exception as e:
             print(f"Exception ----- {str(e)}")
             raise Exception(f"Error preprocessing image: {str(e)}")
-detector = UnderextrusionDetector(
-            model_path="tensorrt_optimized_model",
-            labels_path="labels.txt"
-        )
\ No newline at end of file
+
+
+def defect_from_prediction(prediction_result):
+    """Класс дефекта — первая цифра имени класса; None, если модель не дала предсказания."""
+    file_prediction = prediction_result.get('class_name')
+    if not file_prediction:
+        return None
+    defect_str = str(file_prediction)
+    return int(defect_str[0]) if defect_str else 0
+
+
+@functools.lru_cache(maxsize=None)
+def get_detector():
+    """Детектор создаётся при первом обращении, а не при импорте модуля."""
+    return UnderextrusionDetector(
+        model_path=model_store.MODEL_SOURCE,
+        labels_path=os.path.join(model_store.script_dir, "labels.txt")
+    )
@@ -0,0 +1,147 @@
+import asyncio
+import collections
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+import metrics
+
+# Запросы, которые воркер обрабатывает одновременно; остальные ждут в очереди
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '8'))
+# Длина очереди ожидания; при полной очереди запрос сразу получает 503
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+# Сколько запрос может ждать в очереди, прежде чем получить 503
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_MS', '2000'))
+# Значение Retry-After в ответе 503, секунды
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '1'))
+# Потоки для CPU-тяжёлых этапов (декодирование, grabCut); по умолчанию по числу ядер
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', '0')) or os.cpu_count() or 1
+
+
+class AdmissionController:
+    """
+    Ограничение числа одновременно обрабатываемых запросов в воркере.
+
+    Не больше max_in_flight запросов работают одновременно, ещё до max_queue ждут
+    своей очереди в порядке прихода, но не дольше queue_timeout. Всё сверх этого
+    сразу получает 503 с Retry-After: под всплеском нагрузки лишние запросы
+    отклоняются быстро, а принятые не замедляются все вместе.
+
+    Запрос с несколькими изображениями занимает weight слотов (не больше max_in_flight),
+    поэтому пакетные запросы не обходят ограничение.
+    """
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout_ms=ADMISSION_QUEUE_TIMEOUT_MS, retry_after=ADMISSION_RETRY_AFTER):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout_ms / 1000
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._waiters = collections.deque()
+
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    def _reject(self, reason):
+        metrics.ADMISSION_REJECTED.labels(reason).inc()
+        raise HTTPException(status_code=503, detail='Server is busy, retry later',
+                            headers={'Retry-After': str(self.retry_after)})
+
+    def weight(self, images):
+        """Сколько слотов занимает запрос с images изображениями."""
+        return min(max(1, images), self.max_in_flight)
+
+    async def _acquire(self, wait, weight):
+        if self.in_flight + weight <= self.max_in_flight and not self._waiters:
+            self.in_flight += weight
+            return
+        if not wait or len(self._waiters) >= self.max_queue:
+            self.rejected_full += 1
+            self._reject('queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, weight)
+        self._waiters.append(entry)
+        metrics.ADMISSION_QUEUE.inc()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слоты уже переданы этому запросу, но они больше не нужны
+                self._release(weight)
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                # Ушедший из головы очереди тяжёлый запрос мог задерживать следующих
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_timeout += 1
+                self._reject('queue_timeout')
+            raise
+        finally:
+            metrics.ADMISSION_QUEUE.dec()
+
+    def _wake(self):
+        # Слоты раздаются строго по очереди: лёгкие запросы не обгоняют ждущий тяжёлый
+        while self._waiters:
+            waiter, weight = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if self.in_flight + weight > self.max_in_flight:
+                return
+            self._waiters.popleft()
+            self.in_flight += weight
+            waiter.set_result(None)
+
+    def _release(self, weight):
+        self.in_flight -= weight
+        self._wake()
+
+    @asynccontextmanager
+    async def admit(self, wait=True, weight=1):
+        """
+        Занимает weight слотов на время блока или выбрасывает HTTPException 503.
+
+        wait=False — не вставать в очередь: для потоков кадров, где лучше пропустить кадр,
+        чем анализировать его с опозданием.
+        """
+        weight = min(max(1, weight), self.max_in_flight)
+        await self._acquire(wait, weight)
+        self.admitted += 1
+        metrics.ADMISSION_IN_FLIGHT.inc(weight)
+        try:
+            yield
+        finally:
+            metrics.ADMISSION_IN_FLIGHT.dec(weight)
+            self._release(weight)
+
+    def stats(self):
+        return {
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'queue_timeout_ms': self.queue_timeout * 1000,
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiters),
+            'admitted': self.admitted,
+            'rejected_full': self.rejected_full,
+            'rejected_timeout': self.rejected_timeout,
+        }
+
+
+# Отдельные пулы: CPU-тяжёлая предобработка и модель не занимают пул цикла событий по умолчанию
+cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix='cpu')
+model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model')
+
+
+async def run_cpu(fn, *args):
+    """Как asyncio.to_thread, но в пуле cpu_executor; контекст (Server-Timing) передаётся в поток."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        cpu_executor, functools.partial(context.run, fn, *args)
+    )
@@ -0,0 +1,138 @@
+import os
+import threading
+
+import numpy as np
+
+# Число потоков внутри одной операции и между операциями; 0 — решает сама библиотека
+MODEL_INTRA_OP_THREADS = int(os.getenv('MODEL_INTRA_OP_THREADS', '0'))
+MODEL_INTER_OP_THREADS = int(os.getenv('MODEL_INTER_OP_THREADS', '0'))
+# XNNPACK — оптимизированные CPU-ядра для TFLite; 0 — обычные встроенные ядра
+TFLITE_XNNPACK = os.getenv('TFLITE_XNNPACK', '1') == '1'
+# Провайдеры ONNX Runtime в порядке предпочтения
+ONNX_PROVIDERS = [p for p in os.getenv('ONNX_PROVIDERS', 'CPUExecutionProvider').split(',') if p]
+
+
+class InferenceBackend:
+    """
+    Общий интерфейс движков инференса.
+
+    predict принимает батч float32 формы (N, 224, 224, 3) и возвращает numpy-массив
+    выходов модели (N, число классов). Экземпляр вызываемый, поэтому его можно
+    передавать в BatchScheduler вместо функции.
+    """
+
+    name = None
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, batch):
+        return self.predict(batch)
+
+
+class SavedModelBackend(InferenceBackend):
+    """TensorFlow SavedModel; им же загружается артефакт TF-TRT, это тоже SavedModel."""
+
+    name = 'savedmodel'
+
+    def __init__(self, artifact_dir, intra_op_threads=MODEL_INTRA_OP_THREADS,
+                 inter_op_threads=MODEL_INTER_OP_THREADS):
+        import tensorflow as tf
+
+        try:
+            if intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError:
+            # Потоки задаются только до первой операции TensorFlow в процессе
+            print("TensorFlow is already initialized, thread settings are ignored")
+
+        self._tf = tf
+        self._model = tf.saved_model.load(artifact_dir)
+        self._signature = self._model.signatures['serving_default']
+
+    def predict(self, batch):
+        predictions = self._signature(self._tf.constant(batch))
+        return next(iter(predictions.values())).numpy()
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    TFLite-интерпретатор с делегатом XNNPACK.
+
+    Берёт лёгкий tflite_runtime, если он установлен (достаточно для CPU-коробок без TensorFlow),
+    иначе tf.lite. Интерпретатор не потокобезопасен, поэтому вызовы сериализуются.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, artifact_dir, num_threads=MODEL_INTRA_OP_THREADS, use_xnnpack=TFLITE_XNNPACK):
+        try:
+            from tflite_runtime import interpreter as tflite
+        except ImportError:
+            import tensorflow as tf
+            tflite = tf.lite
+
+        options = {'num_threads': num_threads or None}
+        if not use_xnnpack:
+            options['experimental_op_resolver_type'] = \
+                tflite.experimental.OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        # Интерпретатор отображает файл модели в память, а не копирует его
+        self._interpreter = tflite.Interpreter(model_path=os.path.join(artifact_dir, 'model.tflite'), **options)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output_index = self._interpreter.get_output_details()[0]['index']
+        self._interpreter.allocate_tensors()
+        self._shape = tuple(self._input['shape'])
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=self._input['dtype'])
+        with self._lock:
+            if self._shape != batch.shape:
+                self._interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self._interpreter.allocate_tensors()
+                self._shape = batch.shape
+            self._interpreter.set_tensor(self._input['index'], batch)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output_index).copy()
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime со всеми оптимизациями графа."""
+
+    name = 'onnx'
+
+    def __init__(self, artifact_dir, intra_op_threads=MODEL_INTRA_OP_THREADS,
+                 inter_op_threads=MODEL_INTER_OP_THREADS, providers=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        self._session = ort.InferenceSession(
+            os.path.join(artifact_dir, 'model.onnx'), sess_options=options,
+            providers=providers or ONNX_PROVIDERS
+        )
+        self._input_name = self._session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self._session.run(None, {self._input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+
+BACKEND_CLASSES = {
+    'trt': SavedModelBackend,
+    'savedmodel': SavedModelBackend,
+    'tflite': TFLiteBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def load_backend(backend, artifact_dir, **options):
+    """Загружает артефакт, собранный model_store.ensure_artifact, в движок нужного типа."""
+    try:
+        backend_cls = BACKEND_CLASSES[backend]
+    except KeyError:
+        raise ValueError(f"Unknown model backend: {backend}")
+    return backend_cls(artifact_dir, **options)
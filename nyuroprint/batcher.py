@@ -0,0 +1,203 @@
+import asyncio
+import bisect
+import time
+
+import numpy as np
+
+import metrics
+
+
+class Histogram:
+    """Простая гистограмма с фиксированными границами корзин."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def snapshot(self):
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'count': self.total,
+            'sum': self.sum,
+            'mean': self.sum / self.total if self.total else 0.0,
+        }
+
+
+def aligned_empty(shape, dtype=np.float32, alignment=64):
+    """
+    Неинициализированный массив, начало которого выровнено по alignment байт.
+
+    TensorFlow оборачивает выровненный numpy-массив в тензор без копирования,
+    невыровненный — копирует.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+def copy_into(data, out):
+    np.copyto(out, data)
+
+
+class BatchScheduler:
+    """
+    Собирает одновременные запросы на инференс в один батч.
+
+    Запросы копятся до max_batch_size штук или до истечения max_wait_ms
+    с момента прихода первого запроса, после чего predict_fn вызывается
+    один раз на сложенном тензоре, и каждый вызывающий получает свой результат.
+
+    Тензор батча — один заранее выделенный буфер (max_batch_size, ...) dtype,
+    который переиспользуется от батча к батчу: fill_fn(data, out) пишет каждый образец
+    прямо в свою строку (например, pipeline.normalize из uint8), и predict_fn получает
+    срез буфера без np.stack и промежуточных массивов. Буфер безопасно переиспользовать,
+    потому что батчи выполняются строго по одному; predict_fn не должна возвращать
+    представления входа.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=5.0, executor=None,
+                 fill_fn=copy_into, dtype=np.float32):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.executor = executor
+        self.fill_fn = fill_fn
+        self.dtype = np.dtype(dtype)
+        self._buffer = None
+        self._queue = None
+        self._worker = None
+        # Запросы, уже взятые из очереди в собираемый или выполняемый батч
+        self._inflight = []
+
+        self.queue_depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128])
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.batch_latency_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+
+    async def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает планировщик; ожидающие запросы (и в очереди, и в текущем батче)
+        завершаются ошибкой, чтобы вызывающие и IPC-соединения не зависли.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            pending = [future for _, future in self._inflight]
+            self._inflight = []
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                pending.append(future)
+            for future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batch scheduler stopped"))
+
+    async def submit(self, data):
+        """Ставит один предобработанный образец в очередь и ждёт его результат."""
+        if self._worker is None:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue_depth.observe(self._queue.qsize())
+        metrics.BATCH_QUEUE_DEPTH.observe(self._queue.qsize())
+        await self._queue.put((data, future))
+        return await future
+
+    async def submit_many(self, batch):
+        """
+        Ставит в очередь сразу несколько образцов одного запроса и ждёт все результаты.
+
+        Образцы кладутся в очередь без переключений контекста, поэтому попадают
+        в один батч модели (или в несколько подряд, если их больше max_batch_size).
+        """
+        if self._worker is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        self.queue_depth.observe(self._queue.qsize())
+        metrics.BATCH_QUEUE_DEPTH.observe(self._queue.qsize())
+        futures = []
+        for data in batch:
+            future = loop.create_future()
+            self._queue.put_nowait((data, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self, batch):
+        """Ждёт первый запрос и добирает остальные в пределах окна в batch."""
+        batch.append(await self._queue.get())
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        # Забираем всё, что уже лежит в очереди, не дожидаясь
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _batch_buffer(self, sample_shape):
+        if self._buffer is None or self._buffer.shape[1:] != sample_shape:
+            self._buffer = aligned_empty((self.max_batch_size, *sample_shape), self.dtype)
+        return self._buffer
+
+    def _predict(self, samples):
+        """Выполняется в executor: заполняет строки буфера и вызывает модель на его срезе."""
+        buffer = self._batch_buffer(np.shape(samples[0]))
+        for row, data in zip(buffer, samples):
+            self.fill_fn(data, out=row)
+        return self.predict_fn(buffer[:len(samples)])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Список виден stop(): при остановке посреди сбора или инференса его запросы не теряются
+            batch = self._inflight = []
+            await self._collect(batch)
+            futures = [future for _, future in batch]
+            self.batch_size.observe(len(batch))
+            metrics.BATCH_SIZE.observe(len(batch))
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self._predict, [data for data, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                self.batch_latency_ms.observe(elapsed * 1000)
+                metrics.MODEL_LATENCY.observe(elapsed)
+
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self.queue_depth.snapshot(),
+            'batch_size': self.batch_size.snapshot(),
+            'batch_latency_ms': self.batch_latency_ms.snapshot(),
+        }
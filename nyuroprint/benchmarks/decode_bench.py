@@ -0,0 +1,108 @@
+"""
+Сравнение полного и уменьшенного (DCT-масштабирование libjpeg) декодирования JPEG.
+
+Для каждого JPEG из каталога (по умолчанию uploads/ в корне репозитория) измеряет
+время получения входа модели 224x224: полное декодирование PIL и cv2.imread против
+Image.draft и cv2.IMREAD_REDUCED_COLOR_*. Также выводится средняя абсолютная разница
+пикселей итогового изображения относительно полного декодирования.
+
+Запуск из каталога nyuroprint:
+    python -m benchmarks.decode_bench --images ../uploads --repeat 5
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import pipeline
+from image_decode import decode_image
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+CV2_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def pil_full(data):
+    return pipeline.resize_image(decode_image(data))
+
+
+def pil_draft(data):
+    return pipeline.resize_image(decode_image(data, pipeline.MODEL_INPUT_SIZE))
+
+
+def cv2_full(data):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return pipeline.resize_image(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+
+def cv2_reduced(data):
+    # Размер известен из заголовка: берём наибольший делитель, при котором обе стороны >= 224
+    with Image.open(io.BytesIO(data)) as header:
+        width, height = header.size
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced_flag in CV2_REDUCED:
+        if min(width, height) // factor >= pipeline.MODEL_INPUT_SIZE[0]:
+            flag = reduced_flag
+            break
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    return pipeline.resize_image(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+
+
+METHODS = {
+    'pil_full': pil_full,
+    'pil_draft': pil_draft,
+    'cv2_full': cv2_full,
+    'cv2_reduced': cv2_reduced,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=os.path.join(pipeline.script_dir, '..', 'uploads'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+    args = parser.parse_args()
+
+    files = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith(JPEG_EXTENSIONS):
+            with open(os.path.join(args.images, name), 'rb') as f:
+                files.append((name, f.read()))
+    references = {name: pil_full(data).astype(np.int16) for name, data in files}
+
+    results = []
+    print(f"{len(files)} JPEG files")
+    print(f"{'method':>12} {'median, ms':>11} {'total, ms':>10} {'mean |diff|':>12}")
+    for method, fn in METHODS.items():
+        per_image, diffs = [], []
+        for name, data in files:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                output = fn(data)
+                timings.append((time.perf_counter() - started) * 1000)
+            per_image.append(statistics.median(timings))
+            diffs.append(float(np.abs(output.astype(np.int16) - references[name]).mean()))
+
+        result = {
+            'method': method,
+            'images': len(files),
+            'median_ms': statistics.median(per_image),
+            'total_ms': sum(per_image),
+            'mean_abs_diff': statistics.mean(diffs),
+        }
+        results.append(result)
+        print(f"{method:>12} {result['median_ms']:>11.2f} {result['total_ms']:>10.1f} {result['mean_abs_diff']:>12.2f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Память, выделяемая на передачу предобработанного изображения в модель.
+
+Сравнивает два пути от uint8-выхода pipeline.preprocess до входа движка:
+    stack   прежний: pipeline.normalize в новый float32-массив на каждый запрос, затем np.stack
+    buffer  BatchScheduler.submit_many: нормализация прямо в строки переиспользуемого буфера батча
+
+Для каждого размера батча tracemalloc измеряет пик выделенной памяти на запрос
+(numpy сообщает tracemalloc о своих буферах). Первый батч каждого пути в замер
+не входит: буфер планировщика выделяется один раз при первом батче. Без --backend
+модель не вызывается, измеряется только передача; с --backend вызывается настоящий
+движок из кэша артефактов, и в замер попадают его собственные копии.
+
+Запуск из каталога nyuroprint:
+    python -m benchmarks.handoff_alloc_bench --batch-sizes 1 4 8
+"""
+import argparse
+import asyncio
+import json
+import tracemalloc
+
+import numpy as np
+
+import backends
+import model_store
+import pipeline
+from batcher import BatchScheduler
+
+
+def stack_path(predict_fn, samples):
+    return predict_fn(np.stack([pipeline.normalize(sample) for sample in samples]))
+
+
+async def measure(run, samples, repeat):
+    await run(samples)
+    peaks = []
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        await run(samples)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append((peak - baseline) / len(samples))
+    return float(np.median(peaks))
+
+
+async def run_benchmark(predict_fn, batch_sizes, repeat):
+    rng = np.random.default_rng(0)
+    results = []
+    print(f"{'batch':>5} {'stack, KB/req':>14} {'buffer, KB/req':>15}")
+    for batch_size in batch_sizes:
+        samples = [rng.integers(0, 256, (*pipeline.MODEL_INPUT_SIZE, 3), dtype=np.uint8)
+                   for _ in range(batch_size)]
+        scheduler = BatchScheduler(predict_fn, max_batch_size=batch_size, max_wait_ms=0,
+                                   fill_fn=pipeline.normalize)
+        await scheduler.start()
+        try:
+            before = await measure(
+                lambda batch: asyncio.get_running_loop().run_in_executor(None, stack_path, predict_fn, batch),
+                samples, repeat
+            )
+            after = await measure(scheduler.submit_many, samples, repeat)
+        finally:
+            await scheduler.stop()
+        results.append({'batch_size': batch_size, 'stack_bytes_per_request': before,
+                        'buffer_bytes_per_request': after})
+        print(f"{batch_size:>5} {before / 1024:>14.1f} {after / 1024:>15.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--backend', choices=sorted(backends.BACKEND_CLASSES),
+                        help='Вызывать настоящий движок вместо пустого предсказания')
+    parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+    args = parser.parse_args()
+
+    if args.backend:
+        artifact_dir, _ = model_store.ensure_artifact(args.backend)
+        predict_fn = backends.load_backend(args.backend, artifact_dir).predict
+    else:
+        def predict_fn(batch):
+            return np.zeros((len(batch), 2), dtype=np.float32)
+
+    tracemalloc.start()
+    results = asyncio.run(run_benchmark(predict_fn, args.batch_sizes, args.repeat))
+    tracemalloc.stop()
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
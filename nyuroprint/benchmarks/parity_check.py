@@ -0,0 +1,95 @@
+"""
+Проверка совпадения предсказаний разных движков инференса.
+
+Изображения из каталога (по умолчанию uploads/ в корне репозитория) проходят обычную
+предобработку pipeline.preprocess, после чего каждый движок из --backends предсказывает
+класс. Первый движок — эталон: для остальных выводится число несовпавших классов,
+максимальное расхождение вероятностей и время на изображение. При любом несовпадении
+класса скрипт завершается с кодом 1, поэтому его можно запускать после конвертации.
+
+Артефакты собираются заранее:
+    python model_store.py --backend all
+
+Запуск из каталога nyuroprint:
+    python -m benchmarks.parity_check --backends savedmodel tflite onnx --images ../uploads
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import backends
+import model_store
+import pipeline
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def load_batch(folder, limit):
+    names, arrays = [], []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                arrays.append(pipeline.normalize(pipeline.preprocess(f.read())))
+            names.append(name)
+            if len(names) >= limit:
+                return names, np.stack(arrays)
+    if not names:
+        raise SystemExit(f"No images found in {folder}")
+    return names, np.stack(arrays)
+
+
+def run_backend(backend, batch, batch_size):
+    artifact_dir, version = model_store.ensure_artifact(backend)
+    engine = backends.load_backend(backend, artifact_dir)
+    # Первый вызов (выделение памяти, построение плана) в замер не входит
+    engine.predict(batch[:batch_size])
+
+    outputs = []
+    started = time.perf_counter()
+    for i in range(0, len(batch), batch_size):
+        outputs.append(np.asarray(engine.predict(batch[i:i + batch_size])).reshape(len(batch[i:i + batch_size]), -1))
+    elapsed = time.perf_counter() - started
+    return version, np.concatenate(outputs), elapsed * 1000 / len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', choices=sorted(backends.BACKEND_CLASSES),
+                        default=['savedmodel', 'tflite', 'onnx'])
+    parser.add_argument('--images', default=os.path.join(os.path.dirname(model_store.script_dir), 'uploads'))
+    parser.add_argument('--limit', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--json', dest='json_path', help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    names, batch = load_batch(args.images, args.limit)
+    reference_name, reference, results = None, None, []
+    print(f"{'backend':<12} {'version':<30} {'ms/img':>8} {'mismatch':>9} {'max |dp|':>9}")
+    for backend in args.backends:
+        version, outputs, ms_per_image = run_backend(backend, batch, args.batch_size)
+        if reference is None:
+            reference_name, reference = backend, outputs
+        mismatched = [names[i] for i in np.flatnonzero(outputs.argmax(1) != reference.argmax(1))]
+        max_diff = float(np.max(np.abs(outputs - reference)))
+        results.append({'backend': backend, 'version': version, 'ms_per_image': ms_per_image,
+                        'mismatched': mismatched, 'max_abs_diff': max_diff})
+        print(f"{backend:<12} {version:<30} {ms_per_image:>8.2f} {len(mismatched):>9} {max_diff:>9.2e}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'reference': reference_name, 'images': len(names), 'results': results}, f, indent=2)
+
+    failed = [r for r in results if r['mismatched']]
+    for r in failed:
+        print(f"{r['backend']}: class differs from {reference_name} on {', '.join(r['mismatched'])}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
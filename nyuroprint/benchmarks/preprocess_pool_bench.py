@@ -0,0 +1,102 @@
+"""
+Сравнение предобработки в пуле потоков и в пуле процессов при разной конкурентности.
+
+Изображения из каталога (по умолчанию uploads/ в корне репозитория) по кругу подаются
+в preprocessor.preprocess так же, как в /process_images: файловым объектом, не больше
+--concurrency одновременно. Для каждого исполнителя и уровня конкурентности выводятся
+пропускная способность и задержка p50/p95 одного изображения. Число процессов задаётся
+PREPROCESS_PROCESSES, потоков — CPU_WORKERS; выигрыш процессов ограничен числом ядер.
+
+Запуск из каталога nyuroprint:
+    python -m benchmarks.preprocess_pool_bench --images ../uploads --requests 64
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import time
+
+import pipeline
+import preprocess_pool
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run_level(preprocessor, files, concurrency, requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index):
+        name, data = files[index % len(files)]
+        async with semaphore:
+            started = time.perf_counter()
+            await preprocessor.preprocess(io.BytesIO(data), name)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'images_per_s': requests / elapsed,
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': percentile(latencies, 95),
+    }
+
+
+async def run_executor(kind, files, levels, requests):
+    preprocessor = preprocess_pool.create_preprocessor(kind)
+    await preprocessor.start()
+    try:
+        # Прогрев не входит в замер: запуск процессов и загрузка кодеков
+        await preprocessor.warmup()
+        results = []
+        for concurrency in levels:
+            result = dict(await run_level(preprocessor, files, concurrency, requests), executor=kind)
+            results.append(result)
+            print(f"{kind:>8} {concurrency:>11} {result['images_per_s']:>9.1f} "
+                  f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+        return results
+    finally:
+        await preprocessor.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=os.path.join(pipeline.script_dir, '..', 'uploads'))
+    parser.add_argument('--executors', nargs='+', choices=sorted(preprocess_pool.PREPROCESSORS),
+                        default=['thread', 'process'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--requests', type=int, default=64, help='Изображений на каждый уровень конкурентности')
+    parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+    args = parser.parse_args()
+
+    files = []
+    for name in sorted(os.listdir(args.images)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(args.images, name), 'rb') as f:
+                files.append((name, f.read()))
+    if not files:
+        raise SystemExit(f"No images found in {args.images}")
+
+    print(f"{len(files)} images, {os.cpu_count()} CPUs, {preprocess_pool.PREPROCESS_PROCESSES} processes")
+    print(f"{'executor':>8} {'concurrency':>11} {'img/s':>9} {'p50, ms':>8} {'p95, ms':>8}")
+    results = []
+    for kind in args.executors:
+        results.extend(asyncio.run(run_executor(kind, files, args.concurrency, args.requests)))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
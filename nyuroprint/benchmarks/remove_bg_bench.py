@@ -0,0 +1,93 @@
+"""
+Бенчмарк алгоритмов вырезания фона.
+
+Для каждого изображения из каталога (по умолчанию uploads/ в корне репозитория)
+выполняет ту же подготовку, что и /process_images (декодирование и ImageOps.fit до 224x224),
+и сравнивает задержку каждого алгоритма из SEGMENTATION_BACKENDS и IoU его маски
+с маской исходного двухпроходного grabCut. Эталонная маска считается один раз на изображение;
+grabCut инициализирует GMM случайно, поэтому перед каждым вызовом генератор OpenCV
+сбрасывается на одно и то же зерно и у grabcut IoU с эталоном ровно 1.
+
+Запуск из каталога nyuroprint:
+    python -m benchmarks.remove_bg_bench --images ../uploads --repeat 3
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+import pipeline
+import remove_bg as rb
+
+REFERENCE = 'grabcut'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def load_images(folder, limit):
+    images = []
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(folder, name), 'rb') as f:
+                images.append((name, pipeline.resize_image(pipeline.decode_image(f.read()))))
+        if limit and len(images) >= limit:
+            break
+    return images
+
+
+def segment(backend, image):
+    cv2.setRNGSeed(0)
+    return rb.SEGMENTATION_BACKENDS[backend](image, 0.07, 0.4)
+
+
+def iou(mask, reference):
+    fg, ref = mask > 0, reference > 0
+    union = np.logical_or(fg, ref).sum()
+    return float(np.logical_and(fg, ref).sum() / union) if union else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=os.path.join(pipeline.script_dir, '..', 'uploads'))
+    parser.add_argument('--limit', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit)
+    references = {name: segment(REFERENCE, image) for name, image in images}
+
+    results = []
+    print(f"{'backend':>16} {'median, ms':>11} {'p95, ms':>9} {'mean IoU':>9} {'min IoU':>8}")
+    for backend in rb.SEGMENTATION_BACKENDS:
+        timings, scores = [], []
+        for name, image in images:
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                mask = segment(backend, image)
+                timings.append((time.perf_counter() - started) * 1000)
+            scores.append(iou(mask, references[name]))
+
+        timings.sort()
+        result = {
+            'backend': backend,
+            'images': len(images),
+            'median_ms': statistics.median(timings),
+            'p95_ms': timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0],
+            'mean_iou': statistics.mean(scores),
+            'min_iou': min(scores),
+        }
+        results.append(result)
+        print(f"{backend:>16} {result['median_ms']:>11.2f} {result['p95_ms']:>9.2f} "
+              f"{result['mean_iou']:>9.3f} {result['min_iou']:>8.3f}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+
+from preprocess_pool import preprocessor
+from metrics import FRAME_STREAMS, FRAMES, stage
+from Underextrusion import defect_from_prediction
+
+logger = logging.getLogger(__name__)
+
+# Сколько кадров в секунду анализируется по умолчанию и верхняя граница для параметра fps
+FRAME_SAMPLE_FPS = float(os.getenv('FRAME_SAMPLE_FPS', '1'))
+FRAME_MAX_FPS = float(os.getenv('FRAME_MAX_FPS', '10'))
+# Кадр больше этого размера отбрасывается, не декодируясь
+MAX_FRAME_BYTES = int(os.getenv('MAX_FRAME_BYTES', str(5 * 1024 * 1024)))
+
+
+class LatestFrame:
+    """
+    Слот на один кадр: новый кадр заменяет ещё не обработанный.
+
+    Так очередь не растёт, если камера присылает кадры быстрее, чем их успевает
+    обработать модель, — устаревшие кадры просто отбрасываются.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        """Кладёт кадр; возвращает True, если он вытеснил необработанный."""
+        replaced = self._frame is not None
+        if replaced:
+            self.dropped += 1
+        self._frame = (self.received, frame, time.monotonic())
+        self.received += 1
+        self._event.set()
+        return replaced
+
+    async def take(self):
+        """Ждёт кадр и забирает самый свежий: (номер, байты, время приёма)."""
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class FrameStream:
+    """
+    Поток кадров одной камеры по WebSocket.
+
+    Приём и анализ идут в двух задачах: приём только кладёт байты JPEG в LatestFrame,
+    анализ не чаще sample_fps раз в секунду берёт самый свежий кадр, декодирует его
+    в памяти (на диск кадры не пишутся) и отправляет в модель через общий планировщик
+    батчей. Результат каждого проанализированного кадра уходит клиенту событием defect.
+    """
+
+    def __init__(self, websocket: WebSocket, printer_id, inference, sample_fps=FRAME_SAMPLE_FPS, admission=None):
+        self.websocket = websocket
+        self.printer_id = printer_id
+        self.inference = inference
+        self.admission = admission
+        self.sample_interval = 1.0 / max(0.01, min(sample_fps, FRAME_MAX_FPS))
+        self.frames = LatestFrame()
+        self.analysed = 0
+
+    async def run(self):
+        analyser = asyncio.create_task(self._analyse())
+        FRAME_STREAMS.inc()
+        try:
+            await self._receive()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            FRAME_STREAMS.dec()
+            analyser.cancel()
+            try:
+                await analyser
+            except (asyncio.CancelledError, WebSocketDisconnect):
+                pass
+            except Exception as e:
+                logger.error(f'Frame stream for printer {self.printer_id} failed: {str(e)}')
+        logger.info(f'Frame stream for printer {self.printer_id} closed: received {self.frames.received}, '
+                    f'analysed {self.analysed}, dropped {self.frames.dropped}')
+
+    async def _receive(self):
+        while True:
+            frame = await self.websocket.receive_bytes()
+            FRAMES.labels('received').inc()
+            if len(frame) > MAX_FRAME_BYTES:
+                self.frames.dropped += 1
+                FRAMES.labels('dropped').inc()
+                continue
+            if self.frames.put(frame):
+                FRAMES.labels('dropped').inc()
+
+    async def _predict(self, frame):
+        image_array = await preprocessor.preprocess(frame)
+        with stage('predict'):
+            return await self.inference.submit(image_array)
+
+    async def _analyse(self):
+        next_sample = time.monotonic()
+        while True:
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            index, frame, received_at = await self.frames.take()
+            next_sample = time.monotonic() + self.sample_interval
+
+            try:
+                if self.admission is not None:
+                    # Кадр не ждёт в очереди: если воркер занят, он пропускается, а следующий
+                    # будет свежее
+                    async with self.admission.admit(wait=False):
+                        prediction_result = await self._predict(frame)
+                else:
+                    prediction_result = await self._predict(frame)
+            except HTTPException:
+                self.frames.dropped += 1
+                FRAMES.labels('dropped').inc()
+                continue
+            except Exception as e:
+                logger.error(f'Error processing frame {index} for printer {self.printer_id}: {str(e)}')
+                await self.websocket.send_json({'event': 'error', 'frame': index, 'detail': str(e)})
+                continue
+
+            self.analysed += 1
+            FRAMES.labels('analysed').inc()
+            await self.websocket.send_json({
+                'event': 'defect',
+                'printer_id': self.printer_id,
+                'frame': index,
+                'defect': defect_from_prediction(prediction_result),
+                'confidence': prediction_result.get('confidence'),
+                'latency_ms': round((time.monotonic() - received_at) * 1000, 1),
+                'dropped': self.frames.dropped,
+            })
@@ -0,0 +1,19 @@
+import io
+
+from PIL import Image
+
+
+def decode_image(source, min_size=None):
+    """
+    Декодирует изображение (байты, путь или файловый объект) в RGB-изображение PIL.
+
+    Если задан min_size=(w, h), JPEG декодируется сразу в уменьшенном масштабе
+    (1/2, 1/4 или 1/8 средствами libjpeg) — в наименьший размер, не меньший min_size
+    по обеим сторонам. Для остальных форматов декодируется полный размер.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    if min_size is not None:
+        image.draft("RGB", min_size)
+    return image.convert("RGB")
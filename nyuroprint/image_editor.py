@@ -5,21 +5,29 @@ import asyncio
 import aiofiles
 import io
 
+from image_decode import decode_image
+
 async def enhance_image(image):
     """Улучшает изображение, преобразуя его в черно-белый формат."""
     enhanced_image = await asyncio.to_thread(image.convert, "L")
     return enhanced_image
 
+def process_array(image, max_image_size=(224, 224)):
+    """Синхронная обработка изображения в памяти: уменьшение и перевод в черно-белый формат."""
+    image = image.copy()
+    image.thumbnail(max_image_size, Image.LANCZOS)
+    return image.convert("L")
+
 async def process_image(file_name, input_folder, output_folder, max_image_size=(224, 224)):
     """Обрабатывает одно изображение и сохраняет его в выходную папку."""
     input_path = os.path.join(input_folder, file_name)
     output_path = os.path.join(output_folder, file_name)
 
 
-    # Чтение файла в байты, затем открытие с использованием io.BytesIO
+    # Чтение файла в байты и декодирование сразу в уменьшенном масштабе
     async with aiofiles.open(input_path, 'rb') as f:
         image_data = await f.read()
-        image = await asyncio.to_thread(Image.open, io.BytesIO(image_data))
+        image = await asyncio.to_thread(decode_image, image_data, max_image_size)
 
         await asyncio.to_thread(image.thumbnail, max_image_size, Image.LANCZOS)
 
@@ -1,24 +1,155 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException, WebSocket
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image, ImageOps
 import os
+import hashlib
 import logging
 import asyncio
 import uvicorn
-import aiofiles
 
-import remove_bg as rb
-import image_editor as ie
+import pipeline
+from preprocess_pool import preprocessor
+from admission import AdmissionController, model_executor
 import Underextrusion as un
-from Underextrusion import detector
+from batcher import BatchScheduler
+from frame_stream import FrameStream, FRAME_SAMPLE_FPS
+from model_server import ModelClient, MODEL_SOCKET
+from result_cache import ResultCache
+from metrics import MetricsMiddleware, metrics_response, stage
+from timing import ServerTimingMiddleware
 
 
 # Конфигурация логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Параметры окна микробатчинга
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+
+# Ограничение размера загрузки и размер блока чтения
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Максимум изображений в одном запросе /process_images_batch
+MAX_BATCH_IMAGES = int(os.getenv('MAX_BATCH_IMAGES', '64'))
+
+# local — модель в каждом воркере; ipc — одна модель в model_server.py на все воркеры
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'local')
+# Прогрев модели и предобработки при старте; до его окончания /readyz отвечает 503
+WARMUP = os.getenv('WARMUP', '1') == '1'
+# Таймаут проверки модельного сервера в /readyz, секунды
+READYZ_MODEL_TIMEOUT = float(os.getenv('READYZ_MODEL_TIMEOUT', '2'))
+
+
+def predict_batch(batch):
+    # Детектор загружается при прогреве, а не при импорте, чтобы /healthz отвечал сразу
+    return un.get_detector().predict_batch(batch)
+
+
+def create_inference():
+    if INFERENCE_MODE == 'ipc':
+        return ModelClient(MODEL_SOCKET)
+    # Нормализация uint8 -> float32 идёт прямо в буфер батча планировщика
+    return BatchScheduler(predict_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                          executor=model_executor, fill_fn=pipeline.normalize)
+
+
+inference = create_inference()
+admission = AdmissionController()
+result_cache = ResultCache()
+_model_version = None
+
+
+async def get_model_version():
+    """
+    Версия модели входит в ключ кэша, чтобы смена модели не отдавала старые ответы.
+
+    К ней добавляется алгоритм сегментации фона: он работает в этом воркере и тоже меняет ответ.
+    """
+    global _model_version
+    if _model_version is None:
+        if INFERENCE_MODE == 'ipc':
+            model_version = (await inference.info())['model_version']
+        else:
+            model_version = un.get_detector().model_version
+        _model_version = f"{model_version}-{pipeline.version_tag()}"
+    return _model_version
+
+
+readiness = {'ready': False, 'detail': 'warming up', 'warmup_ms': None}
+
+
+async def warm_up():
+    """
+    Загружает и прогревает модель на всех размерах батча, которые может собрать
+    планировщик (1..BATCH_MAX_SIZE), и один раз прогоняет предобработку.
+
+    В режиме ipc модель прогревает model_server.py до открытия сокета, поэтому
+    достаточно дождаться его ответа.
+    """
+    try:
+        if WARMUP:
+            await preprocessor.warmup()
+        if INFERENCE_MODE == 'ipc':
+            # Сборка TRT-движков в модельном сервере может занять дольше таймаута подключения
+            while True:
+                try:
+                    readiness['warmup_ms'] = (await inference.info()).get('warmup_ms')
+                    break
+                except OSError:
+                    readiness['detail'] = 'waiting for model server'
+                    await asyncio.sleep(1)
+        elif WARMUP:
+            readiness['warmup_ms'] = await asyncio.get_running_loop().run_in_executor(
+                model_executor, lambda: un.get_detector().warmup(range(1, BATCH_MAX_SIZE + 1))
+            )
+        await get_model_version()
+        readiness.update(ready=True, detail='ok')
+        logger.info(f'Worker is ready, warm-up timings: {readiness["warmup_ms"]}')
+    except Exception as e:
+        readiness['detail'] = f'warm-up failed: {str(e)}'
+        logger.error(f'Warm-up failed: {str(e)}')
+
+
+def ensure_ready():
+    """Холодный воркер не берёт запросы: клиент повторит их и попадёт на прогретый."""
+    if not readiness['ready']:
+        raise HTTPException(status_code=503, detail=readiness['detail'], headers={'Retry-After': '1'})
+
+
+async def admit_request():
+    """Зависимость эндпоинтов инференса: воркер прогрет и у запроса есть слот, иначе 503."""
+    ensure_ready()
+    async with admission.admit():
+        yield
+
+
+async def admit_batch(images: List[UploadFile] = File(...)):
+    """Как admit_request, но пакет занимает слот на каждое изображение (не больше max_in_flight)."""
+    ensure_ready()
+    if len(images) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=413, detail=f'Too many images, max {MAX_BATCH_IMAGES}')
+    async with admission.admit(weight=admission.weight(len(images))):
+        yield
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await preprocessor.start()
+    await inference.start()
+    # Прогрев идёт в фоне: сервер уже принимает соединения и отвечает на /healthz
+    warm_up_task = asyncio.create_task(warm_up())
+
+    yield
+
+    warm_up_task.cancel()
+    await inference.stop()
+    await preprocessor.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,63 +157,199 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Длительность запросов по маршрутам и число запросов в работе
+app.add_middleware(MetricsMiddleware)
+# Server-Timing по этапам запроса и выборочный лог медленных запросов
+app.add_middleware(ServerTimingMiddleware)
 
 
 
-# Создание директории для входящих изображений
-script_dir = os.path.dirname(os.path.abspath(__file__))
-input_dir = os.path.join(script_dir, 'input')
-os.makedirs(input_dir, exist_ok=True)
+async def hash_upload(upload):
+    """
+    Считает SHA-256 загрузки блоками, проверяя лимит размера.
+
+    Тело запроса уже лежит во временном файле Starlette, поэтому целиком
+    в память не читается; после хэширования файл перематывается в начало для декодера.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail='Image is too large')
+        digest.update(chunk)
+    await upload.seek(0)
+    return digest.hexdigest()
 
 
 @app.post("/process_images")
-async def process_images_endpoint(image: UploadFile = File(...)):
-    # Сохраняем изображение
-    image_path = os.path.join(input_dir, image.filename)
+async def process_images_endpoint(image: UploadFile = File(...), _=Depends(admit_request)):
     try:
-        async with aiofiles.open(image_path, "wb") as buffer:
-            await buffer.write(await image.read())
-
-        await resize_image(image_path)
-
-        await asyncio.gather(
-            rb.Dremove_bg(input_dir, input_dir, image_name=image.filename),
-            ie.process_single_image(input_dir, input_dir, file_name=image.filename)
-        )
-
-
+        with stage('hash'):
+            digest = await hash_upload(image)
+        model_version = await get_model_version()
+        cached = result_cache.get(digest, model_version)
+        if cached is not None:
+            logger.info('Prediction served from cache')
+            return JSONResponse(content={'message': 'Images processed successfully', 'defect': cached,
+                                         'model_version': model_version, 'cached': True},
+                                status_code=200)
 
-        prediction_result = await asyncio.to_thread(detector.predict, image_path)  # Изменено на image_path
+        # Вся предобработка идёт в памяти над одним декодированным массивом
+        image_array = await preprocessor.preprocess(image.file, image.filename)
+        with stage('predict'):
+            prediction_result = await inference.submit(image_array)
 
         # Извлекаем имя файла и предсказание
-        file_name = os.path.basename(image_path)
-        file_prediction = prediction_result.get('class_name')  # Предполагаем, что возвращается только одно предсказание
+        file_name = image.filename
+        defect_int = un.defect_from_prediction(prediction_result)
 
-        if file_prediction:
-            defect_str = str(file_prediction)
-            defect_int = int(defect_str[0]) if defect_str else 0
+        if defect_int is not None:
+            result_cache.put(digest, model_version, defect_int)
 
             logger.info('Images processed successfully')
-            return JSONResponse(content={'message': 'Images processed successfully', 'defect': defect_int},
+            return JSONResponse(content={'message': 'Images processed successfully', 'defect': defect_int,
+                                         'model_version': model_version, 'cached': False},
                                 status_code=200)
         else:
             logger.error(f'No valid prediction found for "{file_name}": {prediction_result}')
             raise HTTPException(status_code=500, detail='No valid prediction found')
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         logger.error(f'Error processing image: {str(e)}')
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def resize_image(image_path):
-    """Изменяет размер изображения до 224x224 асинхронно."""
-    await asyncio.to_thread(_resize_and_save_image, image_path)
+@app.post("/process_images_batch")
+async def process_images_batch_endpoint(images: List[UploadFile] = File(...), _=Depends(admit_batch)):
+    """
+    Обрабатывает несколько изображений за один запрос.
+
+    Предобработка промахов кэша идёт параллельно в пуле предобработки, но не больше
+    изображений одновременно, чем слотов допуска занял запрос; затем все массивы
+    одним вызовом submit_many уходят в модель. Ошибка одного изображения
+    не валит остальные: результаты возвращаются по каждому файлу в исходном порядке.
+    """
+    limit = asyncio.Semaphore(admission.weight(len(images)))
+
+    async def preprocess(image):
+        async with limit:
+            return await preprocessor.preprocess(image.file, image.filename)
+
+    try:
+        model_version = await get_model_version()
+        results = [{'filename': image.filename} for image in images]
+        with stage('hash'):
+            digests = [await hash_upload(image) for image in images]
+
+        pending = []
+        for index, digest in enumerate(digests):
+            cached = result_cache.get(digest, model_version)
+            if cached is not None:
+                results[index].update(defect=cached, cached=True)
+            else:
+                pending.append(index)
+
+        arrays = await asyncio.gather(
+            *(preprocess(images[i]) for i in pending),
+            return_exceptions=True
+        )
+        ready = []
+        for index, array in zip(pending, arrays):
+            if isinstance(array, Exception):
+                logger.error(f'Error preprocessing "{images[index].filename}": {str(array)}')
+                results[index]['error'] = str(array)
+            else:
+                ready.append((index, array))
+
+        if ready:
+            with stage('predict'):
+                predictions = await inference.submit_many([array for _, array in ready])
+            for (index, _), prediction_result in zip(ready, predictions):
+                defect_int = un.defect_from_prediction(prediction_result)
+                if defect_int is None:
+                    logger.error(f'No valid prediction found for "{images[index].filename}": {prediction_result}')
+                    results[index]['error'] = 'No valid prediction found'
+                    continue
+                result_cache.put(digests[index], model_version, defect_int)
+                results[index].update(defect=defect_int, cached=False)
+
+        logger.info(f'Batch of {len(images)} images processed, {len(ready)} sent to the model')
+        return JSONResponse(content={'message': 'Images processed successfully', 'model_version': model_version,
+                                     'results': results},
+                            status_code=200)
+
+    except HTTPException:
+        raise
+
+    except Exception as e:
+        logger.error(f'Error processing image batch: {str(e)}')
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.websocket("/ws/frames/{printer_id}")
+async def frames_endpoint(websocket: WebSocket, printer_id: int, fps: float = FRAME_SAMPLE_FPS):
+    """
+    Приём потока кадров камеры принтера: бинарные сообщения с JPEG,
+    в ответ — JSON-события defect для проанализированных кадров.
+    """
+    if not readiness['ready']:
+        # 1013 — Try Again Later
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    await FrameStream(websocket, printer_id, inference, sample_fps=fps, admission=admission).run()
+
+
+@app.get("/healthz")
+async def healthz():
+    """Живость процесса: отвечает, даже пока модель прогревается."""
+    return {'status': 'ok'}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Готовность: модель загружена и прогрета, воркер можно нагружать.
+
+    В режиме ipc каждый раз проверяется и модельный сервер: если он упал,
+    healthcheck контейнера должен это увидеть, а не отвечать 200 по старому флагу.
+    """
+    if not readiness['ready']:
+        return JSONResponse(content={'status': 'not_ready', 'detail': readiness['detail']}, status_code=503)
+    if INFERENCE_MODE == 'ipc':
+        try:
+            await asyncio.wait_for(inference.info(), READYZ_MODEL_TIMEOUT)
+        except Exception as e:
+            logger.error(f'Model server is unavailable: {e!r}')
+            return JSONResponse(content={'status': 'not_ready', 'detail': 'model server unavailable'},
+                                status_code=503)
+    return {'status': 'ready', 'model_version': await get_model_version(), 'warmup_ms': readiness['warmup_ms']}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics_response()
+
+
+@app.get("/batch_stats")
+async def batch_stats():
+    """Гистограммы глубины очереди и размеров батчей для настройки окна."""
+    stats = inference.stats()
+    if asyncio.iscoroutine(stats):
+        stats = await stats
+    return stats
+
+
+@app.get("/admission_stats")
+async def admission_stats():
+    return admission.stats()
 
-def _resize_and_save_image(image_path):
-    """Синхронная функция для изменения размера изображения, вызываемая из асинхронного контекста."""
-    image = Image.open(image_path).convert("RGB")
-    size = (224, 224)
-    resized_image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
-    resized_image.save(image_path)
 
+@app.get("/cache_stats")
+async def cache_stats():
+    return result_cache.stats()
 
@@ -0,0 +1,128 @@
+import os
+import time
+from contextlib import contextmanager
+
+from fastapi.responses import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+from timing import record
+
+# С несколькими воркерами uvicorn и model_server.py каждый процесс пишет метрики в файлы
+# этого каталога, а /metrics собирает их вместе. Каталог очищается в start.sh.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Длительность HTTP-запросов',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Запросы, обрабатываемые в данный момент',
+    multiprocess_mode='livesum'
+)
+STAGE_LATENCY = Histogram(
+    'pipeline_stage_duration_seconds', 'Длительность этапов предобработки и инференса',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    'inference_batch_size', 'Число образцов в одном вызове модели',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BATCH_QUEUE_DEPTH = Histogram(
+    'inference_queue_depth', 'Длина очереди планировщика в момент постановки запроса',
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128)
+)
+MODEL_LATENCY = Histogram(
+    'inference_model_duration_seconds', 'Длительность одного вызова модели на батче',
+    buckets=LATENCY_BUCKETS
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight', 'Занятые слоты допуска; пакетный запрос занимает слот на изображение',
+    multiprocess_mode='livesum'
+)
+ADMISSION_QUEUE = Gauge(
+    'admission_queue_depth', 'Запросы, ожидающие допуска',
+    multiprocess_mode='livesum'
+)
+ADMISSION_REJECTED = Counter('admission_rejected_total', 'Запросы, отклонённые с 503', ['reason'])
+FRAME_STREAMS = Gauge(
+    'frame_streams_active', 'Открытые WebSocket-потоки кадров',
+    multiprocess_mode='livesum'
+)
+FRAMES = Counter('frames_total', 'Кадры потоков камер', ['outcome'])
+
+
+@contextmanager
+def stage(name):
+    """
+    Замеряет длительность этапа обработки: with stage('remove_bg'): ...
+
+    Длительность уходит в гистограмму и в заголовок Server-Timing текущего запроса.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(name).observe(elapsed)
+        record(name, elapsed)
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: гистограмма длительности по шаблону маршрута и число запросов в работе.
+
+    Метка route — шаблон пути (/ws/frames/{printer_id}), а не сам путь, иначе
+    каждый printer_id порождал бы новый временной ряд.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(scope['method'], self._route(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
+
+    def _route(self, scope):
+        route = scope.get('route')
+        if route is not None and hasattr(route, 'path'):
+            return route.path
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        if self._paths is None:
+            self._paths = {r.endpoint: r.path for r in scope['app'].routes if hasattr(r, 'endpoint')}
+        return self._paths.get(endpoint, 'unmatched')
+
+
+def metrics_response():
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        body = generate_latest(registry)
+    else:
+        body = generate_latest()
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
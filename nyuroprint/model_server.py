@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+import pipeline
+from admission import model_executor
+from batcher import BatchScheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Путь к Unix-сокету, через который HTTP-воркеры обращаются к модели
+MODEL_SOCKET = os.getenv('MODEL_SOCKET', '/tmp/nyuroprint-model.sock')
+
+_LENGTH = struct.Struct('!I')
+
+
+async def read_message(reader):
+    """Читает кадр: длина заголовка, JSON-заголовок и необязательные сырые байты тензора."""
+    (header_size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    header = json.loads(await reader.readexactly(header_size))
+    payload = await reader.readexactly(header.get('nbytes', 0)) if header.get('nbytes') else b''
+    return header, payload
+
+
+def write_message(writer, header, payload=b''):
+    if payload:
+        header = dict(header, nbytes=len(payload))
+    encoded = json.dumps(header).encode()
+    writer.write(_LENGTH.pack(len(encoded)) + encoded)
+    if payload:
+        writer.write(payload)
+
+
+class ModelServer:
+    """
+    Единственный процесс, владеющий моделью.
+
+    Принимает тензоры от всех HTTP-воркеров по Unix-сокету и пропускает их
+    через общий BatchScheduler, поэтому батчи собираются сразу по всем воркерам.
+    """
+
+    def __init__(self, detector, socket_path=MODEL_SOCKET, max_batch_size=8, max_wait_ms=5.0):
+        self.detector = detector
+        self.socket_path = socket_path
+        # Клиенты присылают uint8 после предобработки (вчетверо меньше float32), нормализует планировщик
+        self.scheduler = BatchScheduler(detector.predict_batch, max_batch_size=max_batch_size,
+                                        max_wait_ms=max_wait_ms, executor=model_executor,
+                                        fill_fn=pipeline.normalize)
+        self._server = None
+        self.warmup_ms = None
+
+    async def start(self):
+        # Сокет появляется только после прогрева, поэтому клиенты не попадают на холодную модель
+        self.warmup_ms = await asyncio.get_running_loop().run_in_executor(
+            model_executor, self.detector.warmup, range(1, self.scheduler.max_batch_size + 1)
+        )
+        await self.scheduler.start()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f'Model server listening on {self.socket_path}')
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.scheduler.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                write_message(writer, await self._dispatch(header, payload))
+                await writer.drain()
+        except Exception as e:
+            logger.error(f'Model server connection error: {str(e)}')
+        finally:
+            writer.close()
+
+    async def _dispatch(self, header, payload):
+        op = header.get('op')
+        try:
+            if op == 'predict':
+                data = np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape'])
+                return {'result': await self.scheduler.submit(data)}
+            if op == 'predict_batch':
+                batch = np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape'])
+                return {'result': await self.scheduler.submit_many(list(batch))}
+            if op == 'stats':
+                return {'result': self.scheduler.stats()}
+            if op == 'info':
+                return {'result': {'model_version': self.detector.model_version, 'backend': self.detector.backend,
+                                   'warmup_ms': self.warmup_ms}}
+            return {'error': f'Unknown operation: {op}'}
+        except Exception as e:
+            return {'error': str(e)}
+
+
+class ModelClient:
+    """
+    Клиент модельного сервера для HTTP-воркеров.
+
+    Повторяет интерфейс BatchScheduler (start/stop/submit/submit_many/stats), поэтому
+    main.py работает одинаково в локальном режиме и в режиме IPC.
+    """
+
+    def __init__(self, socket_path=MODEL_SOCKET, pool_size=4, connect_timeout=60.0):
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self._pool = None
+        self._created = 0
+
+    async def start(self):
+        if self._pool is None:
+            self._pool = asyncio.LifoQueue()
+
+    async def stop(self):
+        if self._pool is not None:
+            while not self._pool.empty():
+                _, writer = self._pool.get_nowait()
+                writer.close()
+            self._pool = None
+            self._created = 0
+
+    async def _connect(self):
+        # Сервер может ещё загружать модель, поэтому ждём появления сокета
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        while True:
+            try:
+                return await asyncio.open_unix_connection(self.socket_path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() >= deadline:
+                    raise
+                await asyncio.sleep(0.5)
+
+    async def _acquire(self):
+        if self._pool.empty() and self._created < self.pool_size:
+            self._created += 1
+            try:
+                return await self._connect()
+            except BaseException:
+                # В том числе отмена по таймауту вызывающего (wait_for в /readyz)
+                self._created -= 1
+                raise
+        return await self._pool.get()
+
+    async def _request(self, header, payload=b''):
+        if self._pool is None:
+            await self.start()
+        reader, writer = await self._acquire()
+        try:
+            write_message(writer, header, payload)
+            await writer.drain()
+            response, _ = await read_message(reader)
+        except BaseException:
+            # Соединение в неизвестном состоянии: закрываем, в пул не возвращаем
+            writer.close()
+            self._created -= 1
+            raise
+        self._pool.put_nowait((reader, writer))
+
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    async def submit(self, data):
+        data = np.ascontiguousarray(data)
+        header = {'op': 'predict', 'dtype': str(data.dtype), 'shape': list(data.shape)}
+        return await self._request(header, data.tobytes())
+
+    async def submit_many(self, batch):
+        """Отправляет все образцы одним сообщением; на сервере они идут в один батч."""
+        data = np.ascontiguousarray(np.stack(batch))
+        header = {'op': 'predict_batch', 'dtype': str(data.dtype), 'shape': list(data.shape)}
+        return await self._request(header, data.tobytes())
+
+    async def stats(self):
+        return await self._request({'op': 'stats'})
+
+    async def info(self):
+        return await self._request({'op': 'info'})
+
+
+if __name__ == '__main__':
+    from Underextrusion import get_detector
+
+    server = ModelServer(
+        get_detector(),
+        max_batch_size=int(os.getenv('BATCH_MAX_SIZE', '8')),
+        max_wait_ms=float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+    )
+    asyncio.run(server.serve_forever())
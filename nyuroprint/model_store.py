@@ -0,0 +1,258 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Исходная SavedModel, из которой собираются все артефакты
+MODEL_SOURCE = os.getenv('MODEL_SOURCE', os.path.join(script_dir, 'keras_model_saved_model'))
+# Каталог кэша собранных артефактов (один на все воркеры)
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.join(script_dir, 'model_cache'))
+# trt | savedmodel | tflite | onnx; пусто — trt при наличии GPU, иначе savedmodel
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', '')
+# Размеры батчей, под которые заранее собираются TensorRT-движки
+TRT_BUILD_BATCH_SIZES = [int(b) for b in os.getenv('TRT_BUILD_BATCH_SIZES', '1,8').split(',') if b]
+# Квантованный вариант TFLite (dynamic | int8 | fp16), допущенный через quantize.py --promote;
+# пусто — исходная float-модель
+MODEL_VARIANT = os.getenv('MODEL_VARIANT', '')
+# Версия набора операций ONNX при конвертации
+ONNX_OPSET = int(os.getenv('ONNX_OPSET', '13'))
+
+BACKENDS = ('trt', 'savedmodel', 'tflite', 'onnx')
+INPUT_SHAPE = (224, 224, 3)
+MANIFEST = 'manifest.json'
+
+
+def fingerprint(source_dir):
+    """SHA-256 по относительным путям и содержимому всех файлов SavedModel."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, source_dir).encode())
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_backend():
+    """trt, если TensorFlow видит GPU, иначе обычная SavedModel на CPU."""
+    if MODEL_BACKEND:
+        return MODEL_BACKEND
+    import tensorflow as tf
+    return 'trt' if tf.config.list_physical_devices('GPU') else 'savedmodel'
+
+
+@contextmanager
+def _build_lock(cache_dir):
+    """Межпроцессная блокировка: артефакт собирает только один воркер."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _build_trt(source_dir, output_dir):
+    from tensorflow.python.compiler.tensorrt import trt_convert as trt
+
+    converter = trt.TrtGraphConverterV2(
+        input_saved_model_dir=source_dir,
+        precision_mode=trt.TrtPrecisionMode.FP16,
+        allow_build_at_runtime=True
+    )
+    print("Converting model to TensorRT...")
+    converter.convert()
+
+    def input_fn():
+        for batch_size in TRT_BUILD_BATCH_SIZES:
+            yield [np.zeros((batch_size, *INPUT_SHAPE), dtype=np.float32)]
+
+    # Движки строятся сейчас, а не на первых запросах
+    print("Building TensorRT engines...")
+    converter.build(input_fn=input_fn)
+    converter.save(output_dir)
+
+
+def _build_tflite(source_dir, output_dir):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(source_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'model.tflite'), 'wb') as f:
+        f.write(converter.convert())
+
+
+def _build_onnx(source_dir, output_dir):
+    # tf2onnx запускается отдельным процессом: ему нужен чистый граф TensorFlow
+    os.makedirs(output_dir, exist_ok=True)
+    subprocess.run(
+        [sys.executable, '-m', 'tf2onnx.convert', '--saved-model', source_dir,
+         '--output', os.path.join(output_dir, 'model.onnx'), '--opset', str(ONNX_OPSET)],
+        check=True
+    )
+
+
+BUILDERS = {
+    'trt': _build_trt,
+    'tflite': _build_tflite,
+    'onnx': _build_onnx,
+}
+
+
+def export_saved_model(h5_path, output_dir):
+    """Пересобирает исходную SavedModel из keras_model.h5 (если она отсутствует или устарела)."""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(h5_path, compile=False)
+    tf.saved_model.save(model, output_dir)
+
+
+def _package_version(name):
+    from importlib import metadata
+
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def build_info(backend):
+    """
+    Всё, от чего кроме исходной модели зависит собранный артефакт: версии инструментов
+    и параметры сборки. Сериализованные движки TensorRT привязаны к версии TensorRT и GPU,
+    поэтому после обновления образа кэш на примонтированном томе не должен загружаться.
+    """
+    info = {'backend': backend}
+    if backend == 'trt':
+        import tensorflow as tf
+
+        build = tf.sysconfig.get_build_info()
+        info.update(tensorflow=tf.__version__, cuda=build.get('cuda_version'), cudnn=build.get('cudnn_version'),
+                    batch_sizes=TRT_BUILD_BATCH_SIZES)
+        try:
+            from tensorflow.compiler.tf2tensorrt import _pywrap_py_utils
+            info['tensorrt'] = '.'.join(map(str, _pywrap_py_utils.get_loaded_tensorrt_version()))
+        except ImportError:
+            info['tensorrt'] = None
+        info['gpus'] = [
+            tf.config.experimental.get_device_details(gpu).get('device_name')
+            for gpu in tf.config.list_physical_devices('GPU')
+        ]
+    elif backend == 'onnx':
+        info.update(tf2onnx=_package_version('tf2onnx'), opset=ONNX_OPSET)
+    # Файлы .tflite и .onnx переносимы между версиями сред выполнения, а для сборки
+    # версия TensorFlow берётся из метаданных пакета: загружать сам TensorFlow не нужно
+    if backend in ('tflite', 'onnx'):
+        info['tensorflow'] = _package_version('tensorflow')
+    return info
+
+
+def build_fingerprint(info):
+    return hashlib.sha256(json.dumps(info, sort_keys=True).encode()).hexdigest()
+
+
+def variant_version(variant, source_fingerprint):
+    return f"tflite-{variant}-{source_fingerprint[:16]}"
+
+
+def _manifest_matches(manifest_path, build):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f).get('build') == build
+    except (OSError, ValueError):
+        return False
+
+
+def ensure_artifact(backend=None, source_dir=MODEL_SOURCE, cache_dir=MODEL_CACHE_DIR, variant=MODEL_VARIANT):
+    """
+    Возвращает (путь к артефакту, версия модели), собирая артефакт только при первом обращении.
+
+    Артефакт хранится под отпечатком исходной модели и отпечатком сборки (build_info),
+    поэтому после замены модели, обновления TensorFlow/TensorRT или смены параметров сборки
+    он пересобирается автоматически, а все последующие старты только загружают готовый.
+    Квантованные варианты здесь не собираются: их кладёт в кэш quantize.py --promote,
+    и только если вариант прошёл порог совпадения с float-моделью; вариант, допущенный
+    при другой версии TensorFlow, не загружается.
+    """
+    backend = backend or default_backend()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {backend}")
+
+    source_fingerprint = fingerprint(source_dir)
+    version = f"{backend}-{source_fingerprint[:16]}"
+
+    if variant:
+        if backend != 'tflite':
+            raise ValueError("Quantized model variants are served only by the tflite backend")
+        version = variant_version(variant, source_fingerprint)
+        artifact_dir = os.path.join(cache_dir, version)
+        manifest_path = os.path.join(artifact_dir, MANIFEST)
+        build = build_info(backend)
+        if not _manifest_matches(manifest_path, build):
+            # quantize.py --promote мог как раз подменять каталог под блокировкой
+            with _build_lock(cache_dir):
+                if not _manifest_matches(manifest_path, build):
+                    raise RuntimeError(f"Model variant {variant} is not promoted for this model and build, "
+                                       f"run: python quantize.py --promote {variant}")
+        return artifact_dir, version
+
+    # Для CPU SavedModel конвертация не нужна
+    if backend not in BUILDERS:
+        return source_dir, version
+
+    build = build_info(backend)
+    artifact_dir = os.path.join(cache_dir, f"{version}-{build_fingerprint(build)[:8]}")
+    manifest_path = os.path.join(artifact_dir, MANIFEST)
+    if _manifest_matches(manifest_path, build):
+        return artifact_dir, version
+
+    with _build_lock(cache_dir):
+        # Другой воркер мог собрать артефакт, пока мы ждали блокировку
+        if _manifest_matches(manifest_path, build):
+            return artifact_dir, version
+
+        build_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=cache_dir)
+        try:
+            BUILDERS[backend](source_dir, build_dir)
+            with open(os.path.join(build_dir, MANIFEST), 'w') as f:
+                json.dump({'backend': backend, 'source': source_dir, 'fingerprint': source_fingerprint,
+                           'build': build}, f)
+            shutil.rmtree(artifact_dir, ignore_errors=True)
+            os.rename(build_dir, artifact_dir)
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+
+    return artifact_dir, version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сборка артефактов модели заранее, до старта сервиса")
+    parser.add_argument('--backend', choices=BACKENDS + ('all',), default=None,
+                        help="all — собрать артефакты для всех CPU-движков (savedmodel, tflite, onnx)")
+    parser.add_argument('--from-h5', metavar='H5_PATH',
+                        help="Сначала экспортировать исходную SavedModel из .h5 в MODEL_SOURCE")
+    args = parser.parse_args()
+
+    if args.from_h5:
+        export_saved_model(args.from_h5, MODEL_SOURCE)
+        print(f"SavedModel exported to {MODEL_SOURCE}")
+
+    backends = ('savedmodel', 'tflite', 'onnx') if args.backend == 'all' else (args.backend,)
+    for backend in backends:
+        path, model_version = ensure_artifact(backend)
+        print(f"Model artifact ready: {path} ({model_version})")
@@ -0,0 +1,93 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import image_decode
+import remove_bg as rb
+import image_editor as ie
+from metrics import stage
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Сохранение промежуточных результатов на диск — только для отладки
+DEBUG_SAVE = os.getenv('PIPELINE_DEBUG_SAVE', '0') == '1'
+DEBUG_DIR = os.getenv('PIPELINE_DEBUG_DIR', os.path.join(script_dir, 'input'))
+
+MODEL_INPUT_SIZE = (224, 224)
+
+
+def version_tag():
+    """
+    Параметры предобработки, от которых зависит вход модели. Добавляются к версии модели
+    в ключе кэша предсказаний: смена алгоритма сегментации меняет маску, а с ней и ответ.
+    """
+    return f"bg-{rb.REMOVE_BG_BACKEND}"
+
+
+def decode_image(data, size=MODEL_INPUT_SIZE):
+    """Декодирует загрузку сразу в наименьший масштаб, из которого ещё можно получить size."""
+    return image_decode.decode_image(data, min_size=size)
+
+
+def resize_image(image, size=MODEL_INPUT_SIZE):
+    """Обрезает и масштабирует изображение до размера входа модели."""
+    return np.asarray(ImageOps.fit(image, size, Image.Resampling.LANCZOS))
+
+
+def remove_background(image_array):
+    """Вырезает фон с теми же параметрами, что и Dremove_bg."""
+    return rb.remove_bg_array(image_array, main_rect_size=0.07, fg_size=0.4, resize_to=MODEL_INPUT_SIZE[0])
+
+
+def normalize(image_array, out=None):
+    """
+    Приводит uint8 RGB к диапазону [-1, 1], который ожидает модель.
+
+    С out результат пишется прямо в готовый float32-массив (строку батча) без промежуточных копий.
+    """
+    out = np.divide(image_array, np.float32(127.5), out=out, dtype=np.float32)
+    return np.subtract(out, 1, out=out)
+
+
+def _save_debug(name, stage, image):
+    os.makedirs(DEBUG_DIR, exist_ok=True)
+    base, _ = os.path.splitext(os.path.basename(name))
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    image.save(os.path.join(DEBUG_DIR, f"{base}.{stage}.png"))
+
+
+def preprocess(data, name=None):
+    """
+    Полная предобработка одной загрузки в памяти: decode -> resize -> remove_bg.
+
+    Возвращает RGB-массив uint8 размера 224x224x3. Изображение декодируется
+    один раз, и ни одна стадия не читает и не пишет файлы, если не включён PIPELINE_DEBUG_SAVE.
+    """
+    with stage('decode'):
+        image = decode_image(data)
+    with stage('resize'):
+        resized = resize_image(image)
+    with stage('remove_bg'):
+        masked = remove_background(resized)
+
+    if DEBUG_SAVE and name:
+        _save_debug(name, 'resized', resized)
+        _save_debug(name, 'masked', masked)
+        # Черно-белая версия раньше перезаписывалась результатом remove_bg
+        # и в модель не попадала, поэтому считается только для отладки
+        with stage('image_editor'):
+            gray = ie.process_array(Image.fromarray(resized), MODEL_INPUT_SIZE)
+        _save_debug(name, 'gray', gray)
+
+    return masked
+
+
+def warmup():
+    """Один проход предобработки по синтетическому JPEG: загружает кодеки и инициализирует OpenCV."""
+    gradient = np.linspace(0, 255, 640 * 480 * 3, dtype=np.float32).reshape(480, 640, 3).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(gradient).save(buffer, 'JPEG')
+    preprocess(buffer.getvalue())
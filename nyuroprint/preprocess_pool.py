@@ -0,0 +1,197 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import pipeline
+import timing
+from admission import run_cpu
+
+# thread — предобработка в пуле потоков cpu_executor; process — в пуле процессов
+PREPROCESS_EXECUTOR = os.getenv('PREPROCESS_EXECUTOR', 'thread')
+# Число процессов предобработки; по умолчанию по числу ядер
+PREPROCESS_PROCESSES = int(os.getenv('PREPROCESS_PROCESSES', '0')) or os.cpu_count() or 1
+# Закрепить каждый процесс за своим ядром (по кругу)
+PREPROCESS_PIN_CPUS = os.getenv('PREPROCESS_PIN_CPUS', '0') == '1'
+# Место под исходный файл в каждом слоте разделяемой памяти; файлы крупнее передаются копией
+PREPROCESS_SLOT_INPUT_BYTES = int(os.getenv('PREPROCESS_SLOT_INPUT_BYTES', str(8 * 1024 * 1024)))
+
+OUTPUT_SHAPE = (*pipeline.MODEL_INPUT_SIZE, 3)
+OUTPUT_BYTES = int(np.prod(OUTPUT_SHAPE))
+
+# Разделяемая память, уже открытая в процессе-воркере, по имени сегмента
+_attached = {}
+
+
+def _init_worker(counter, pin_cpus):
+    if pin_cpus and hasattr(os, 'sched_setaffinity'):
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+
+
+def _slot_view(slot_name):
+    segment = _attached.get(slot_name)
+    if segment is None:
+        segment = _attached[slot_name] = shared_memory.SharedMemory(name=slot_name)
+    return segment.buf
+
+
+def _preprocess_in_slot(slot_name, input_size, capacity, data=None, name=None):
+    """
+    Выполняется в процессе пула: читает файл из слота (или из data, если он не поместился),
+    пишет результат uint8 в выходную часть того же слота и возвращает замеры этапов.
+    """
+    buf = _slot_view(slot_name)
+    if data is None:
+        data = bytes(buf[:input_size])
+
+    stages = []
+    token = timing._stages.set(stages)
+    try:
+        result = pipeline.preprocess(data, name)
+    finally:
+        timing._stages.reset(token)
+    np.ndarray(OUTPUT_SHAPE, dtype=np.uint8, buffer=buf, offset=capacity)[...] = result
+    return stages
+
+
+class ThreadPreprocessor:
+    """Предобработка в пуле потоков: OpenCV и PIL отпускают GIL на тяжёлых операциях."""
+
+    kind = 'thread'
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def warmup(self):
+        await run_cpu(pipeline.warmup)
+
+    async def preprocess(self, source, name=None):
+        return await run_cpu(pipeline.preprocess, source, name)
+
+
+class ProcessPreprocessor:
+    """
+    Предобработка в пуле процессов без передачи массивов через pickle.
+
+    У каждой задачи свой слот разделяемой памяти: исходный файл читается прямо в слот,
+    процесс-воркер декодирует его и пишет готовый массив 224x224x3 в тот же слот,
+    а по каналу пула передаются только имя слота и длина. Слотов вдвое больше процессов,
+    чтобы следующий файл копировался, пока воркер ещё занят предыдущим.
+    Замеры этапов возвращаются из процесса и попадают в Server-Timing запроса;
+    гистограммы Prometheus процессы пишут сами через PROMETHEUS_MULTIPROC_DIR.
+    """
+
+    kind = 'process'
+
+    def __init__(self, processes=PREPROCESS_PROCESSES, slot_input_bytes=PREPROCESS_SLOT_INPUT_BYTES,
+                 pin_cpus=PREPROCESS_PIN_CPUS):
+        self.processes = processes
+        self.capacity = slot_input_bytes
+        self.pin_cpus = pin_cpus
+        self._executor = None
+        self._slots = []
+        self._free = None
+
+    async def start(self):
+        if self._executor is not None:
+            return
+        # forkserver: воркеры не наследуют потоки и состояние TensorFlow родителя
+        context = multiprocessing.get_context('forkserver')
+        counter = context.Value('i', 0)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=context,
+            initializer=_init_worker, initargs=(counter, self.pin_cpus)
+        )
+        self._free = asyncio.Queue()
+        for _ in range(self.processes * 2):
+            slot = shared_memory.SharedMemory(create=True, size=self.capacity + OUTPUT_BYTES)
+            self._slots.append(slot)
+            self._free.put_nowait(slot)
+
+    async def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._slots = []
+
+    async def warmup(self):
+        """По одному прогреву на процесс: пул поднимает процессы и грузит кодеки до первого запроса."""
+        if self._executor is None:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, pipeline.warmup) for _ in range(self.processes)
+        ))
+
+    def _write_input(self, source, slot):
+        """Копирует загрузку в слот; возвращает (размер, bytes для передачи копией или None)."""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = source
+        else:
+            source.seek(0)
+            readinto = getattr(source, 'readinto', None)
+            if readinto is not None:
+                # Читаем на байт больше ёмкости, чтобы заметить файл, который не поместился
+                view = slot.buf[:self.capacity]
+                size = readinto(view)
+                extra = source.read(1)
+                if not extra:
+                    return size, None
+                source.seek(0)
+            data = source.read()
+
+        if len(data) <= self.capacity:
+            slot.buf[:len(data)] = data
+            return len(data), None
+        return len(data), bytes(data)
+
+    async def preprocess(self, source, name=None):
+        if self._executor is None:
+            await self.start()
+        slot = await self._free.get()
+        future = None
+        try:
+            size, data = self._write_input(source, slot)
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, _preprocess_in_slot, slot.name, size, self.capacity, data, name
+            )
+            stages = await asyncio.shield(future)
+            for stage_name, seconds in stages:
+                timing.record(stage_name, seconds)
+            return np.ndarray(OUTPUT_SHAPE, dtype=np.uint8, buffer=slot.buf, offset=self.capacity).copy()
+        finally:
+            if future is None or future.done():
+                self._free.put_nowait(slot)
+            else:
+                # Запрос отменён, но запущенную в процессе задачу не отменить: воркер ещё пишет
+                # в слот, поэтому слот вернётся в очередь только после её завершения
+                future.add_done_callback(lambda _: self._free.put_nowait(slot))
+
+
+PREPROCESSORS = {
+    'thread': ThreadPreprocessor,
+    'process': ProcessPreprocessor,
+}
+
+
+def create_preprocessor(kind=PREPROCESS_EXECUTOR, **options):
+    try:
+        return PREPROCESSORS[kind](**options)
+    except KeyError:
+        raise ValueError(f"Unknown preprocess executor: {kind}")
+
+
+preprocessor = create_preprocessor()
@@ -0,0 +1,214 @@
+"""
+Офлайн-квантование классификатора в TFLite и допуск вариантов к обслуживанию.
+
+Собирает из исходной SavedModel три варианта:
+    dynamic  веса INT8, активации float (dynamic-range)
+    int8     полное INT8-квантование, калибровка на изображениях из uploads/
+    fp16     веса FP16
+
+Каждый вариант сравнивается с float-моделью TFLite на тех же изображениях: доля совпавших
+классов (всего и по каждой метке из labels.txt), размер файла и время на изображение.
+Повторные загрузки одного файла учитываются один раз (по SHA-256 содержимого). Первые
+--calibration-size изображений идут только на калибровку int8, оценка — по остальным
+(отложенная выборка), иначе int8 проверялся бы на тех же данных, по которым калибровался.
+Отчёт пишется в report.json рядом с вариантами.
+
+--promote VARIANT кладёт вариант в кэш артефактов под версией tflite-<вариант>-<отпечаток>,
+только если его совпадение не ниже QUANT_MIN_AGREEMENT; после этого сервис
+обслуживает его при MODEL_BACKEND=tflite и MODEL_VARIANT=<вариант>.
+
+Запуск из каталога nyuroprint:
+    python quantize.py --images ../uploads
+    python quantize.py --promote int8
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import backends
+import model_store
+import pipeline
+
+# Минимальная доля совпадений с float-моделью, при которой вариант можно обслуживать
+QUANT_MIN_AGREEMENT = float(os.getenv('QUANT_MIN_AGREEMENT', '0.99'))
+QUANT_DIR = os.path.join(model_store.MODEL_CACHE_DIR, 'quantized')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+VARIANTS = ('dynamic', 'int8', 'fp16')
+
+
+def load_images(folder, limit):
+    """Нормализованные входы модели для различных по содержимому изображений каталога (не больше limit)."""
+    arrays = []
+    seen = set()
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(root, name), 'rb') as f:
+                    data = f.read()
+                digest = hashlib.sha256(data).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                arrays.append(pipeline.normalize(pipeline.preprocess(data)))
+                if len(arrays) >= limit:
+                    return np.stack(arrays)
+    if not arrays:
+        raise SystemExit(f"No images found in {folder}")
+    return np.stack(arrays)
+
+
+def convert(variant, source_dir, calibration):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(source_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        def representative_dataset():
+            for sample in calibration:
+                yield [sample[np.newaxis].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Вход и выход остаются float32: модель подменяется без изменений в predict_batch
+    return converter.convert()
+
+
+def evaluate(engine, images, reference_classes, class_names):
+    outputs = []
+    started = time.perf_counter()
+    for sample in images:
+        outputs.append(np.asarray(engine.predict(sample[np.newaxis])).reshape(-1))
+    ms_per_image = (time.perf_counter() - started) * 1000 / len(images)
+
+    classes = np.stack(outputs).argmax(1)
+    per_class = {}
+    for index, name in enumerate(class_names):
+        mask = reference_classes == index
+        if mask.any():
+            per_class[name] = float((classes[mask] == index).mean())
+    return {
+        'agreement': float((classes == reference_classes).mean()),
+        'agreement_per_class': per_class,
+        'ms_per_image': ms_per_image,
+    }, classes
+
+
+def build_report(args):
+    source_fingerprint = model_store.fingerprint(model_store.MODEL_SOURCE)
+    output_dir = os.path.join(QUANT_DIR, source_fingerprint[:16])
+    with open(os.path.join(model_store.script_dir, 'labels.txt')) as f:
+        class_names = [line.strip() for line in f if line.strip()]
+
+    images = load_images(args.images, args.limit)
+    calibration, holdout = images[:args.calibration_size], images[args.calibration_size:]
+    if not len(holdout):
+        raise SystemExit(f"Only {len(images)} distinct images, nothing left for evaluation after "
+                         f"{args.calibration_size} calibration images; lower --calibration-size")
+
+    float_dir, float_version = model_store.ensure_artifact('tflite', variant='')
+    float_engine = backends.load_backend('tflite', float_dir, num_threads=args.threads)
+    reference_classes = np.stack([
+        np.asarray(float_engine.predict(sample[np.newaxis])).reshape(-1) for sample in holdout
+    ]).argmax(1)
+    float_metrics, _ = evaluate(float_engine, holdout, reference_classes, class_names)
+    report = {
+        'source_fingerprint': source_fingerprint,
+        'reference': float_version,
+        'images': len(images),
+        'calibration_images': len(calibration),
+        'holdout_images': len(holdout),
+        'min_agreement': args.min_agreement,
+        'variants': {
+            'float': dict(float_metrics, size_bytes=os.path.getsize(os.path.join(float_dir, 'model.tflite'))),
+        },
+    }
+
+    for variant in args.variants:
+        variant_dir = os.path.join(output_dir, variant)
+        os.makedirs(variant_dir, exist_ok=True)
+        model_path = os.path.join(variant_dir, 'model.tflite')
+        print(f"Converting {variant}...")
+        with open(model_path, 'wb') as f:
+            f.write(convert(variant, model_store.MODEL_SOURCE, calibration))
+
+        engine = backends.load_backend('tflite', variant_dir, num_threads=args.threads)
+        metrics, _ = evaluate(engine, holdout, reference_classes, class_names)
+        metrics['size_bytes'] = os.path.getsize(model_path)
+        metrics['passed'] = metrics['agreement'] >= args.min_agreement
+        report['variants'][variant] = metrics
+
+    with open(os.path.join(output_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'variant':<8} {'size, KB':>9} {'ms/img':>8} {'agreement':>10} {'passed':>7}")
+    for variant, metrics in report['variants'].items():
+        passed = '' if variant == 'float' else ('yes' if metrics['passed'] else 'no')
+        print(f"{variant:<8} {metrics['size_bytes'] / 1024:>9.0f} {metrics['ms_per_image']:>8.2f} "
+              f"{metrics['agreement']:>10.3f} {passed:>7}")
+    print(f"Report saved to {os.path.join(output_dir, 'report.json')}")
+
+
+def promote(variant, min_agreement):
+    """Кладёт вариант в кэш артефактов, если по последнему отчёту он прошёл порог."""
+    source_fingerprint = model_store.fingerprint(model_store.MODEL_SOURCE)
+    output_dir = os.path.join(QUANT_DIR, source_fingerprint[:16])
+    report_path = os.path.join(output_dir, 'report.json')
+    if not os.path.exists(report_path):
+        raise SystemExit("No quantization report for the current model, run quantize.py first")
+    with open(report_path) as f:
+        metrics = json.load(f)['variants'].get(variant)
+    if metrics is None:
+        raise SystemExit(f"Variant {variant} is not in {report_path}")
+    if metrics['agreement'] < min_agreement:
+        raise SystemExit(f"Variant {variant} agreement {metrics['agreement']:.3f} "
+                         f"is below the threshold {min_agreement:.3f}, not promoted")
+
+    version = model_store.variant_version(variant, source_fingerprint)
+    artifact_dir = os.path.join(model_store.MODEL_CACHE_DIR, version)
+    build = model_store.build_info('tflite')
+    # Под той же блокировкой, что и сборка в ensure_artifact: воркер, стартующий во время
+    # подмены, дождётся её конца, а не увидит каталог без манифеста
+    with model_store._build_lock(model_store.MODEL_CACHE_DIR):
+        build_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=model_store.MODEL_CACHE_DIR)
+        try:
+            shutil.copy(os.path.join(output_dir, variant, 'model.tflite'), build_dir)
+            with open(os.path.join(build_dir, model_store.MANIFEST), 'w') as f:
+                json.dump({'backend': 'tflite', 'variant': variant, 'source': model_store.MODEL_SOURCE,
+                           'fingerprint': source_fingerprint, 'agreement': metrics['agreement'],
+                           'build': build}, f)
+            shutil.rmtree(artifact_dir, ignore_errors=True)
+            os.rename(build_dir, artifact_dir)
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+    print(f"Promoted {variant} as {version}; serve it with MODEL_BACKEND=tflite MODEL_VARIANT={variant}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=os.path.join(os.path.dirname(model_store.script_dir), 'uploads'))
+    parser.add_argument('--limit', type=int, default=500,
+                        help="Сколько различных изображений использовать (калибровка и оценка вместе)")
+    parser.add_argument('--calibration-size', type=int, default=100)
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument('--threads', type=int, default=backends.MODEL_INTRA_OP_THREADS)
+    parser.add_argument('--min-agreement', type=float, default=QUANT_MIN_AGREEMENT)
+    parser.add_argument('--promote', choices=VARIANTS, help="Допустить вариант к обслуживанию")
+    args = parser.parse_args()
+
+    if args.promote:
+        promote(args.promote, args.min_agreement)
+    else:
+        build_report(args)
+
+
+if __name__ == '__main__':
+    main()
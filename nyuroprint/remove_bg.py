@@ -3,54 +3,124 @@ import os
 import numpy as np
 import asyncio
 
-async def remove_bg(image_name, in_path="img", out_path="out", main_rect_size=0.02, fg_size=4, resize_to=500):
-    img = cv2.imread(os.path.join(in_path, image_name))
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    img_height, img_width = img.shape[:2]
-    width, height = img_width, img_height
-
-    # Изменение размера изображения
-    if resize_to > 0:
-        if img_width > img_height:
-            height = resize_to
-            width = round(img_width * height / img_height)
-        else:
-            width = resize_to
-            height = round(img_height * width / img_width)
+from image_decode import decode_image
 
-    img_small = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+# Алгоритм сегментации по умолчанию, см. SEGMENTATION_BACKENDS
+REMOVE_BG_BACKEND = os.getenv('REMOVE_BG_BACKEND', 'grabcut_lowres')
 
-    # Создаем маску
-    mask = np.zeros(img_small.shape[:2], np.uint8)
 
-    # Параметры для вырезки фона
+def _rects(width, height, main_rect_size, fg_size):
     bg_w, bg_h = round(width * main_rect_size), round(height * main_rect_size)
     fg_w, fg_h = round(width * (1 - fg_size) / 2), round(height * (1 - fg_size) / 2)
 
     bg_rect = (bg_w, bg_h, width - bg_w, height - bg_h)
     fg_rect = (fg_w, fg_h, width - fg_w, height - fg_h)
+    return bg_rect, fg_rect, bg_w
+
+
+def grabcut_mask(img_small, main_rect_size, fg_size, rect_iterations=3, mask_iterations=10):
+    """Исходный алгоритм: grabCut по прямоугольнику (3 итерации), затем уточнение по маске (10 итераций)."""
+    height, width = img_small.shape[:2]
+
+    # Создаем маску
+    mask = np.zeros(img_small.shape[:2], np.uint8)
+
+    # Параметры для вырезки фона
+    bg_rect, fg_rect, bg_w = _rects(width, height, main_rect_size, fg_size)
 
     # Метки на маске
     cv2.rectangle(mask, fg_rect[:2], fg_rect[2:4], color=1, thickness=-1)
 
     bgd_model1, fgd_model1 = np.zeros((1, 65), np.float64), np.zeros((1, 65), np.float64)
 
-    # Асинхронное выполнение grabCut
     try:
-        await asyncio.to_thread(cv2.grabCut, img_small, mask, bg_rect, bgd_model1, fgd_model1, 3, cv2.GC_INIT_WITH_RECT)
+        cv2.grabCut(img_small, mask, bg_rect, bgd_model1, fgd_model1, rect_iterations, cv2.GC_INIT_WITH_RECT)
         mask1 = mask.copy()
         cv2.rectangle(mask, (bg_rect[0], bg_rect[1]), (bg_rect[2], bg_rect[3]), color=2, thickness=bg_w * 3)
-        await asyncio.to_thread(cv2.grabCut, img_small, mask, bg_rect, bgd_model1, fgd_model1, 10,
-                                cv2.GC_INIT_WITH_MASK)
+        cv2.grabCut(img_small, mask, bg_rect, bgd_model1, fgd_model1, mask_iterations, cv2.GC_INIT_WITH_MASK)
     except Exception:
         mask = mask1.copy()
 
-    mask_result = np.where((mask == 1) + (mask == 3), 255, 0).astype('uint8')
+    return np.where((mask == 1) + (mask == 3), 255, 0).astype('uint8')
+
+
+def grabcut_lowres_mask(img_small, main_rect_size, fg_size, scale=0.5, rect_iterations=1, mask_iterations=4):
+    """Те же два прохода grabCut, но на уменьшенной копии и с меньшим числом итераций; маска масштабируется обратно."""
+    height, width = img_small.shape[:2]
+    low = cv2.resize(img_small, (max(1, round(width * scale)), max(1, round(height * scale))),
+                     interpolation=cv2.INTER_AREA)
+    mask_low = grabcut_mask(low, main_rect_size, fg_size, rect_iterations, mask_iterations)
+    return cv2.resize(mask_low, (width, height), interpolation=cv2.INTER_NEAREST)
+
+
+def threshold_mask(img_small, main_rect_size, fg_size):
+    """
+    Быстрый путь для однотонного стола принтера: цвет фона оценивается по рамке
+    изображения, передний план — пиксели, заметно отличающиеся от него (порог Оцу).
+    """
+    height, width = img_small.shape[:2]
+    bg_rect, _, bg_w = _rects(width, height, main_rect_size, fg_size)
+
+    # Рамка той же толщины, что и метка фона во втором проходе grabCut
+    band = max(1, bg_w * 2)
+    border = np.ones((height, width), bool)
+    border[band:height - band, band:width - band] = False
+    lab = cv2.cvtColor(img_small, cv2.COLOR_RGB2LAB).astype(np.float32)
+    bg_color = np.median(lab[border], axis=0)
+
+    distance = np.linalg.norm(lab - bg_color, axis=2)
+    distance = cv2.normalize(distance, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    _, mask = cv2.threshold(distance, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    kernel = np.ones((3, 3), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    # За пределами прямоугольника фона переднего плана нет, как и в grabCut
+    mask[:bg_rect[1], :] = 0
+    mask[bg_rect[3]:, :] = 0
+    mask[:, :bg_rect[0]] = 0
+    mask[:, bg_rect[2]:] = 0
+    return mask
+
+
+# Все алгоритмы возвращают маску uint8 того же размера: 255 — объект, 0 — фон
+SEGMENTATION_BACKENDS = {
+    'grabcut': grabcut_mask,
+    'grabcut_lowres': grabcut_lowres_mask,
+    'threshold': threshold_mask,
+}
+
+
+def remove_bg_array(img, main_rect_size=0.02, fg_size=4, resize_to=500, backend=None):
+    """Вырезает фон у RGB-изображения в памяти и возвращает RGB-массив с синим фоном."""
+    img_height, img_width = img.shape[:2]
+    width, height = img_width, img_height
+
+    # Изменение размера изображения
+    if resize_to > 0:
+        if img_width > img_height:
+            height = resize_to
+            width = round(img_width * height / img_height)
+        else:
+            width = resize_to
+            height = round(img_height * width / img_width)
+
+    img_small = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+    mask_result = SEGMENTATION_BACKENDS[backend or REMOVE_BG_BACKEND](img_small, main_rect_size, fg_size)
 
     # Применяем маску
     masked = cv2.bitwise_and(img_small, img_small, mask=mask_result)
     masked[mask_result < 2] = [0, 0, 255]  # меняем фон на синий
+    return masked
+
+
+async def remove_bg(image_name, in_path="img", out_path="out", main_rect_size=0.02, fg_size=4, resize_to=500):
+    min_size = (resize_to, resize_to) if resize_to > 0 else None
+    img = np.asarray(decode_image(os.path.join(in_path, image_name), min_size))
+
+    # Асинхронное выполнение grabCut
+    masked = await asyncio.to_thread(remove_bg_array, img, main_rect_size, fg_size, resize_to)
 
     # Сохраняем результат
     masked = cv2.cvtColor(masked, cv2.COLOR_RGB2BGR)
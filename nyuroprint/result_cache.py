@@ -0,0 +1,36 @@
+import os
+from collections import OrderedDict
+
+# Число результатов, которые хранит каждый процесс
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '4096'))
+
+
+class ResultCache:
+    """LRU-кэш предсказаний по хэшу содержимого загрузки и версии модели."""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest, model_version):
+        key = (digest, model_version)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, digest, model_version, value):
+        if self.max_entries <= 0:
+            return
+        key = (digest, model_version)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
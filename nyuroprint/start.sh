@@ -0,0 +1,36 @@
+#!/bin/sh
+# В режиме ipc модель загружается один раз в отдельном процессе,
+# а воркеры uvicorn только декодируют изображения и пересылают тензоры.
+# Файлы метрик прошлых процессов не должны попадать в /metrics
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+run_uvicorn() {
+    exec uvicorn main:app --host 0.0.0.0 --port 3000 --workers "${WORKERS:-10}" --proxy-headers --forwarded-allow-ips "*"
+}
+
+if [ "$INFERENCE_MODE" != "ipc" ]; then
+    run_uvicorn
+fi
+
+# Без модельного сервера воркеры бесполезны: если упал любой из двух процессов,
+# останавливаем второй и выходим с ошибкой, чтобы Docker перезапустил контейнер
+python model_server.py &
+MODEL_PID=$!
+run_uvicorn &
+UVICORN_PID=$!
+
+STOPPING=0
+trap 'STOPPING=1; kill -TERM $UVICORN_PID $MODEL_PID 2>/dev/null' TERM INT
+
+while kill -0 $MODEL_PID 2>/dev/null && kill -0 $UVICORN_PID 2>/dev/null; do
+    sleep 2
+done
+
+kill -TERM $UVICORN_PID $MODEL_PID 2>/dev/null
+wait
+[ "$STOPPING" = "1" ] && exit 0
+echo "A nyuroprint process exited, stopping the container" >&2
+exit 1
@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+
+# Запросы дольше порога попадают в лог медленных запросов с долей SLOW_REQUEST_SAMPLE_RATE
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', '0.1'))
+
+slow_logger = logging.getLogger('slow_requests')
+
+# Этапы текущего запроса: (имя, длительность в секундах). Список общий для задач и потоков,
+# запущенных из запроса, потому что они получают копию контекста с тем же объектом.
+_stages = ContextVar('server_timing_stages', default=None)
+
+
+def record(name, seconds):
+    """Добавляет длительность этапа к текущему запросу; вне запроса ничего не делает."""
+    stages = _stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+def _summarize(stages):
+    # Повторяющиеся этапы (например, предобработка каждого изображения батча) складываются
+    totals = {}
+    for name, seconds in stages:
+        totals[name] = totals.get(name, 0.0) + seconds * 1000
+    return totals
+
+
+def format_server_timing(totals):
+    return ', '.join(f'{name};dur={ms:.1f}' for name, ms in totals.items())
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI-middleware: заголовок Server-Timing с длительностями этапов запроса
+    и выборочный лог запросов дольше SLOW_REQUEST_MS с полной разбивкой.
+    """
+
+    def __init__(self, app, slow_ms=SLOW_REQUEST_MS, sample_rate=SLOW_REQUEST_SAMPLE_RATE):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stages = []
+        token = _stages.set(stages)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                totals = _summarize(stages)
+                totals['total'] = (time.perf_counter() - started) * 1000
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', format_server_timing(totals).encode('latin-1')))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stages.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            if total_ms >= self.slow_ms and random.random() < self.sample_rate:
+                slow_logger.warning(json.dumps({
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'status': status,
+                    'total_ms': round(total_ms, 1),
+                    'stages_ms': {name: round(ms, 1) for name, ms in _summarize(stages).items()},
+                }))